@@ -5,6 +5,7 @@ import pandas as pd, re
 from helper import flatten
 import database as DB
 from logger import Logger
+from contextlib import nullcontext
 class AnnualReport(PDF, Logger):
     def __init__(self, src, news_id, date_time, stock_code, stock_name, title, long_text, file_info):
         super().__init__(src)
@@ -14,7 +15,6 @@ class AnnualReport(PDF, Logger):
         self.stock_name = stock_name
         self.title = title
         self.long_text = long_text
-        self.src = src
         self.file_info = file_info
     
     @classmethod
@@ -29,9 +29,10 @@ class AnnualReport(PDF, Logger):
     def src(self, src):
         PDF.src.fset(self, src)
         self.logger.info(f'Processing indepdentent audit reports')
-        audit_report_outlines = self.get_outline(IndependentAuditorReport.title_regex)
+        audit_report_outlines = self.get_outline(IndependentAuditorReport.title_regex, IndependentAuditorReport.prefilter_regex)
         audit_reports = [IndependentAuditorReport.create(outline) for outline in audit_report_outlines if audit_report_outlines]
         self._audit_reports = audit_reports
+        self._extracted = None
         self.logger.info(f'Indepdentent audit reports: {self._audit_reports} ready')
         
             
@@ -52,8 +53,20 @@ class AnnualReport(PDF, Logger):
         kams = [audit_report.kams for audit_report in audit_reports if audit_reports and audit_report.kams]
         return kams
     
-    @Logger.track
-    def add_annual_report_to_db(self, session):
+    @property
+    def extracted(self) -> tuple:
+        '''
+        (auditor names, [(kam item, tags)]) read from the pdf once, so records can be rebuilt without reading it again
+        '''
+        if self._extracted is None:
+            kam_items = flatten([kam.items for kam in self.kams])
+            self._extracted = (sorted(self.auditors), list(zip(kam_items, KeyAuditMatter.get_tags_many(kam_items))))
+        return self._extracted
+
+    def get_annual_report_record(self) -> DB.AnnualReport:
+        '''
+        new annual report record with its auditor, kam and kam tag records attached, nothing is written yet
+        '''
         annual_report_record = DB.AnnualReport(
                 news_id = self.news_id, 
                 date_time = self.date_time, 
@@ -64,88 +77,58 @@ class AnnualReport(PDF, Logger):
                 file_info = self.file_info,
                 file_link = self.src
                 )
-        
-        session.add(annual_report_record)
-        session.commit()
-        self.logger.info(f'>> annual report: {annual_report_record} inserted to {annual_report_record.__tablename__}')
-    
-    @Logger.track
-    def add_auditors_to_db(self, session):
-        auditors = self.auditors
-        for auditor in auditors:
-            auditor_record = DB.Auditor(news_id = self.news_id, name = auditor)
-            session.add(auditor_record)
-            session.commit()
-            self.logger.info(f'>> auditor: {auditor_record} inserted to {auditor_record.__tablename__}')
-            
-    @Logger.track
-    def add_kams_and_kam_tags_to_db(self, session):
-        kam_items = flatten([kam.items for kam in self.kams])
-        for kam_item in kam_items:
-            kam_item_record = DB.KeyAuditMatter(news_id = self.news_id, item = kam_item)
-            session.add(kam_item_record)
-            session.commit()
-            self.logger.info(f'>> kam_item: {kam_item_record} inserted to {kam_item_record.__tablename__}')
-            self.add_kam_tags_to_db(session = session, kam_item_record=kam_item_record)
-    
-    @Logger.track
-    def add_kam_tags_to_db(self, session , kam_item_record):
-        tags = KeyAuditMatter.get_tags(kam_item_record.item)
-        for tag in tags:
-            kam_tag_record = DB.KeyAuditMatterTag(news_id = self.news_id, kam_id = kam_item_record.id, tag = tag)
-            session.add(kam_tag_record)
-            session.commit()
-            self.logger.info(f'>> kam_tag: {kam_tag_record} inserted to {kam_tag_record.__tablename__}')
-    
-    @Logger.track
-    def add_to_db(self):
-               
-        db = DB.DataBase(DB.path)
-        
-        with db.Session() as session:
-            self.add_annual_report_to_db(session)
-            self.add_auditors_to_db(session)
-            self.add_kams_and_kam_tags_to_db(session)
-            # self.logger.info('Loading annual report to db')
-            # annual_report_record = DB.AnnualReport(
-            #     news_id = self.news_id, 
-            #     date_time = self.date_time, 
-            #     stock_code = self.stock_code, 
-            #     stock_name = self.stock_name, 
-            #     title = self.title, 
-            #     long_text = self.long_text, 
-            #     file_info = self.file_info,
-            #     file_link = self.src
-            #     )
-        
-            # session.add(annual_report_record)
-            # session.commit()
-            # self.logger.info(f'>> annual report: {annual_report_record} inserted to {annual_report_record.__tablename__}')
-            # self.logger.info('Finish loading annual report to db')
+        annual_report_record.audit_firms = self.get_auditor_records()
+        annual_report_record.kams = self.get_kam_records()
+        return annual_report_record
 
+    def get_auditor_records(self) -> list:
+        auditors, _ = self.extracted
+        return [DB.Auditor(news_id = self.news_id, name = auditor) for auditor in auditors]
 
-            # auditors = self.auditors
-            # self.logger.info(f'Loading auditors to db')
-            # for auditor in auditors:
-            #     auditor_record = DB.Auditor(news_id = annual_report_record.news_id, name = auditor)
-            #     session.add(auditor_record)
-            #     session.commit()
-            #     self.logger.info(f'>> auditor: {auditor_record} inserted to {auditor_record.__tablename__}')
-            # self.logger.info('Finish loading auditors to db')
+    def get_kam_records(self) -> list:
+        _, kams = self.extracted
+        kam_records = []
+        for kam_item, tags in kams:
+            kam_item_record = DB.KeyAuditMatter(news_id = self.news_id, item = kam_item)
+            kam_item_record.tags = [DB.KeyAuditMatterTag(news_id = self.news_id, tag = tag) for tag in tags]
+            kam_records.append(kam_item_record)
+        return kam_records
 
-            
-            # self.logger.info('Loading kams and kam tags to db')
-            # kam_items = flatten([kam.items for kam in self.kams])
-            # for kam_item in kam_items:
-            #     kam_item_record = DB.KeyAuditMatter(news_id = annual_report_record.news_id, item = kam_item)
-            #     session.add(kam_item_record)
-            #     session.commit()
-            #     self.logger.info(f'>> kam_item: {kam_item_record} inserted to {kam_item_record.__tablename__}')
+    @Logger.track
+    def add_to_db(self, session=None, db=None, annual_report_record=None):
+        '''
+        write the annual report with its auditors, auditor aliases, kams and kam tags as one unit of work
+        session: add within this session (committed by its owner, e.g. AnnualReport.add_all_to_db) instead of a new one
+        annual_report_record: record built beforehand, so no pdf is read while the transaction holds the db lock
+        '''
+        db = db or DB.DataBase(DB.path)
+        annual_report_record = annual_report_record or self.get_annual_report_record()
+        auditor_names = [auditor.name for auditor in annual_report_record.audit_firms]
+        db.auditor_resolver.match_many(auditor_names) # score new names before the transaction, add_auditor_aliases reuses them
+        with nullcontext(session) if session is not None else db.Session() as session:
+            session.add(annual_report_record)
+            n_aliases = db.add_auditor_aliases(auditor_names, session=session)
+            self.logger.info(
+                f'>> annual report: {annual_report_record} with {len(annual_report_record.audit_firms)} auditors, '
+                f'{len(annual_report_record.kams)} kams, {sum(len(kam.tags) for kam in annual_report_record.kams)} kam tags '
+                f'and {n_aliases} new auditor aliases added')
 
-            #     tags = KeyAuditMatter.get_tags(kam_item)
-            #     for tag in tags:
-            #         kam_tag_record = DB.KeyAuditMatterTag(news_id = annual_report_record.news_id, kam_id = kam_item_record.id, tag = tag)
-            #         session.add(kam_tag_record)
-            #         session.commit()
-            #         self.logger.info(f'>> kam_tag: {kam_tag_record} inserted to {kam_tag_record.__tablename__}')
-            # self.logger.info('Finish loading kams and kam tags to db')
\ No newline at end of file
+    @classmethod
+    def add_all_to_db(cls, annual_reports: list, db=None):
+        '''
+        write a batch of annual reports in a single transaction; the records are built first, a report whose
+        extraction fails is logged and left out of the batch
+        '''
+        db = db or DB.DataBase(DB.path)
+        logger = cls.get_module_logger()
+        records = []
+        for annual_report in annual_reports:
+            try:
+                records.append((annual_report, annual_report.get_annual_report_record()))
+            except Exception as e:
+                logger.error(f'{annual_report} skipped: {e}')
+        db.auditor_resolver.match_many(auditor.name for _, record in records for auditor in record.audit_firms)
+        with db.Session() as session:
+            for annual_report, record in records:
+                annual_report.add_to_db(session=session, db=db, annual_report_record=record)
+        logger.info(f'{len(records)} annual reports committed')
@@ -1,13 +1,13 @@
 import pandas as pd
-import re
 from helper import flatten
+from keyword_matcher import KeywordRegistry
 from pdf import PDF, Outline, ReportOutline, PageWithSection
-import database as DB
 
 
 class IndependentAuditorReport(ReportOutline):
 
     title_regex = r'^(?!.*internal)(?=.*report|.*responsibilities).*auditor.*$'
+    prefilter_regex = r'auditor'
 
     def __init__(self, outline):
         super().__init__(outline)
@@ -18,7 +18,7 @@ class IndependentAuditorReport(ReportOutline):
 
     @property
     def kams(self) -> list:
-        return KeyAuditMatter.retrieve(self.pages)
+        return KeyAuditMatter.retrieve(self.pages, self.outline)
 
 
 class Auditor:
@@ -59,18 +59,22 @@ class Auditor:
 
 class KeyAuditMatter(PageWithSection):
     section_regex = r'Key Audit Matter[s]*'
-    keywords = pd.read_sql(
-        DB.KeyAuditMatterKeywords.__tablename__, DB.path).keyword.to_list()
+    prefilter_regex = r'KeyAuditMatter'
+    registry = KeywordRegistry()
 
     def __init__(self, kam_pages):
         super().__init__(kam_pages)
 
     @classmethod
     def get_tags(cls, string) -> list:
-        keywords = cls.keywords
-        tags = {keyword for keyword in keywords if re.search(
-            keyword, string, flags=re.IGNORECASE)}
-        return sorted(tags)
+        return cls.registry.matcher.tags(string)
+
+    @classmethod
+    def get_tags_many(cls, strings) -> list:
+        '''
+        tags of each string, for tagging a whole column of kam items at once
+        '''
+        return cls.registry.matcher.tag_many(strings)
 
     @property
     def items(self) -> list:
@@ -79,45 +83,43 @@ class KeyAuditMatter(PageWithSection):
 
     @property
     def tags(self) -> set:
-        kams = self.items
-        keywords = self.keywords
-        tags = {keyword for keyword in keywords if any(
-            re.search(keyword, kam, flags=re.IGNORECASE) for kam in kams)}
-        return sorted(tags)
+        return self.registry.matcher.any(self.items)
 
     @property
     def df_kams(self) -> pd.DataFrame:
         dfs_feature_text = self.dfs_feature_text
-        kam_cond = dfs_feature_text.text.str.contains(
-            '|'.join(KeyAuditMatter.keywords), flags=re.IGNORECASE)
+        if dfs_feature_text.empty:
+            return dfs_feature_text
+        kam_cond = dfs_feature_text.text.str.contains(self.registry.matcher.any_regex)
         return dfs_feature_text[kam_cond]
 
     @property
     def dfs_feature_text(self) -> pd.DataFrame:
-        df = pd.DataFrame()
-        for page in self.pages:
-            df_feature_text = page.df_feature_text
-            if not df_feature_text.empty:
-                df_feature_text = self.group_feature_text(df_feature_text)
-                df_feature_text['page_num'] = page.page_number
-                df = df.append(df_feature_text, ignore_index=True)
-        return df
+        dfs = [page.df_feature_text.assign(page_num=page.page_number) for page in self.pages]
+        dfs = [df for df in dfs if not df.empty]
+        if not dfs:
+            return pd.DataFrame()
+        return self.group_feature_text(pd.concat(dfs, ignore_index=True))
 
     @staticmethod
     def group_feature_text(df_feature_text):
-        text_interval = df_feature_text['bottom'].shift(
-        ) - df_feature_text['top']
-        indicator = (text_interval.abs() > df_feature_text['size']).cumsum()
-        df_feature_text = df_feature_text.groupby(indicator).agg({
+        '''
+        merge the feature text lines of all pages into paragraphs in a single groupby keyed on (page_num, line gap indicator)
+        '''
+        page_num = df_feature_text['page_num'].to_numpy()
+        text_interval = df_feature_text['bottom'].groupby(page_num).shift() - df_feature_text['top']
+        indicator = (text_interval.abs() > df_feature_text['size']).cumsum().to_numpy()
+        df_feature_text = df_feature_text.groupby([page_num, indicator], sort=False).agg({
             'top': 'first',
             'bottom': 'last',
             'fontname': 'first',
             'size': 'first',
             'x0': 'first',
             'x1': 'first',
-            'text': ''.join
+            'text': ''.join,
+            'page_num': 'first'
         })
-        return df_feature_text
+        return df_feature_text.reset_index(drop=True)
 
     def __repr__(self) -> str:
         return f'<{self.__class__.__name__} {self.pages} - {self.tags}>'
@@ -0,0 +1,115 @@
+import re
+from collections import OrderedDict
+from typing import Iterable
+from fuzzywuzzy import process, fuzz
+from logger import Logger
+try:
+    from rapidfuzz import process as rf_process, fuzz as rf_fuzz, utils as rf_utils
+except ImportError:
+    rf_process = None
+
+class AuditorResolver(Logger):
+
+    '''
+    usage:
+        map raw auditor names extracted from reports to validated auditor names (validated_auditor table)
+
+    note:
+        - same rule as the original Worker.validate_auditor: best token_set_ratio match, accepted at
+          min_similarity (80 for names of 4 characters or less)
+        - each distinct name is scored once, all new names of a batch against all valid names in one
+          rapidfuzz.process.cdist call when rapidfuzz is installed, otherwise with fuzzywuzzy one by one
+        - rapidfuzz scores are not guaranteed to equal fuzzywuzzy's (different preprocessing and rounding), so a
+          name close to the threshold may be accepted by one and rejected by the other
+        - scores are kept in a bounded lru cache of cache_size names
+    '''
+
+    min_similarity = 90
+    short_min_similarity = 80
+    short_len = 4
+    cache_size = 10000
+    noise_regex = r's*(limited|Touche Tohmatsu)'
+
+    def __init__(self, valid_auditors: list, cache_size=None):
+        super().__init__()
+        self.valid_auditors = list(valid_auditors)
+        self.cache_size = cache_size or AuditorResolver.cache_size
+        self._cache = OrderedDict()
+
+    @classmethod
+    def create(cls, db, **kwargs):
+        return cls(db.query_valid_auditors().v_auditors.to_list(), **kwargs)
+
+    @classmethod
+    def preprocess(cls, r_auditor: str) -> str:
+        return re.sub(cls.noise_regex, '', r_auditor, flags=re.IGNORECASE)
+
+    def score_many(self, names: Iterable[str]) -> dict:
+        '''
+        {preprocessed name: (best valid auditor, similarity)}, scoring only names missing from the cache
+        '''
+        names = list(dict.fromkeys(names))
+        new_names = [name for name in names if name not in self._cache]
+        if new_names and self.valid_auditors:
+            self.logger.debug(f'Scoring {len(new_names)} new auditor names')
+            for name, result in zip(new_names, self.extract(new_names)):
+                self._cache[name] = result
+        scores = {}
+        for name in names:
+            if name in self._cache:
+                self._cache.move_to_end(name)
+                scores[name] = self._cache[name]
+            else:
+                scores[name] = (None, 0)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return scores
+
+    def extract(self, names: list) -> list:
+        if rf_process is None:
+            return [process.extractOne(name, self.valid_auditors, scorer=fuzz.token_set_ratio) for name in names]
+        similarity = rf_process.cdist(
+            names, self.valid_auditors, scorer=rf_fuzz.token_set_ratio, processor=rf_utils.default_process, workers=-1)
+        best = similarity.argmax(axis=1)
+        return [(self.valid_auditors[i], int(round(similarity[row, i]))) for row, i in enumerate(best)]
+
+    def threshold(self, name: str, min_similarity=None) -> int:
+        if len(name) <= self.short_len:
+            return self.short_min_similarity
+        return min_similarity or self.min_similarity
+
+    def match_many(self, r_auditors: Iterable[str], min_similarity=None) -> list:
+        '''
+        (validated name or None, similarity) of each raw name
+        '''
+        names = [self.preprocess(r_auditor) for r_auditor in r_auditors]
+        scores = self.score_many(names)
+        matches = []
+        for name in names:
+            valid_auditor, similarity = scores[name]
+            accepted = valid_auditor is not None and similarity >= self.threshold(name, min_similarity)
+            matches.append((valid_auditor if accepted else None, similarity))
+        return matches
+
+    def resolve_many(self, r_auditors: Iterable[str], min_similarity=None, others=None) -> list:
+        '''
+        validated (upper case) name of each raw name; unmatched names become others if given, else stay as preprocessed
+        '''
+        r_auditors = list(r_auditors)
+        resolved = []
+        for r_auditor, (valid_auditor, _) in zip(r_auditors, self.match_many(r_auditors, min_similarity)):
+            if valid_auditor is not None:
+                resolved.append(valid_auditor.upper())
+            else:
+                resolved.append(others.upper() if others else self.preprocess(r_auditor))
+        return resolved
+
+    def resolve(self, r_auditor: str, min_similarity=None, others=None) -> str:
+        return self.resolve_many([r_auditor], min_similarity, others)[0]
+
+    def __repr__(self):
+        return f'<{self.__class__.__name__} {len(self.valid_auditors)} valid auditors, {len(self._cache)} cached>'
+
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,181 @@
+import numpy as np, pandas as pd
+from collections import Counter
+from typing import Union
+
+class CharStore:
+
+    '''
+    usage:
+        columnar view of pdfplumber page.chars for page layout analysis
+
+    note:
+        - fontname is interned to integer ids into CharStore.fonts (sorted)
+        - coordinates and size are float32, upright and is_ascii are bool
+        - filters are boolean masks over the arrays, CharStore.frame(mask) builds a DataFrame of the selected chars only
+    '''
+
+    columns = ['text', 'fontname', 'size', 'x0', 'x1', 'top', 'bottom', 'upright']
+
+    def __init__(self, text, font_id, fonts, size, x0, x1, top, bottom, upright, is_ascii):
+        self.text = text
+        self.font_id = font_id
+        self.fonts = fonts
+        self.size = size
+        self.x0 = x0
+        self.x1 = x1
+        self.top = top
+        self.bottom = bottom
+        self.upright = upright
+        self.is_ascii = is_ascii
+
+    @classmethod
+    def from_chars(cls, chars: list):
+        n = len(chars)
+        coord = lambda key: np.fromiter((char[key] for char in chars), dtype=np.float32, count=n)
+        text = np.array([char['text'] for char in chars], dtype=object)
+        fonts, font_id = np.unique(np.array([char['fontname'] for char in chars], dtype=object), return_inverse=True)
+        return cls(
+            text=text,
+            font_id=font_id.astype(np.int32),
+            fonts=fonts,
+            size=coord('size'),
+            x0=coord('x0'),
+            x1=coord('x1'),
+            top=coord('top'),
+            bottom=coord('bottom'),
+            upright=np.fromiter((bool(char['upright']) for char in chars), dtype=bool, count=n),
+            is_ascii=np.fromiter((char['text'].isascii() for char in chars), dtype=bool, count=n)
+        )
+
+    def __len__(self):
+        return len(self.text)
+
+    def lang_mask(self, lang=None) -> np.ndarray:
+        '''
+        'en': chars without non-ascii text, 'cn': chars with non-ascii text, otherwise all chars
+        '''
+        if lang == 'en':
+            return self.is_ascii
+        if lang == 'cn':
+            return ~self.is_ascii
+        return np.ones(len(self), dtype=bool)
+
+    @property
+    def bbox_mask(self) -> np.ndarray:
+        return (self.x0 > 0) & (self.top > 0) & (self.x1 > 0) & (self.bottom > 0)
+
+    def mask(self, lang=None) -> np.ndarray:
+        return self.lang_mask(lang) & self.bbox_mask
+
+    def font_mask(self, fontnames) -> np.ndarray:
+        font_ids = np.flatnonzero(np.isin(self.fonts, np.asarray(fontnames, dtype=object)))
+        return np.isin(self.font_id, font_ids)
+
+    def size_mask(self, sizes) -> np.ndarray:
+        return np.isin(self.size, np.asarray(sizes, dtype=np.float32))
+
+    def mode_fontnames(self, mask: np.ndarray) -> pd.Series:
+        '''
+        most frequent fontnames among masked chars, same as DataFrame.fontname.mode()
+        '''
+        counts = np.bincount(self.font_id[mask], minlength=len(self.fonts))
+        if not counts.any():
+            return pd.Series([], dtype=object)
+        return pd.Series(self.fonts[counts == counts.max()])
+
+    def mode_sizes(self, mask: np.ndarray) -> pd.Series:
+        '''
+        most frequent sizes among masked chars, same as DataFrame.size.mode()
+        '''
+        sizes, counts = np.unique(self.size[mask], return_counts=True)
+        if not counts.size:
+            return pd.Series([], dtype=np.float32)
+        return pd.Series(sizes[counts == counts.max()])
+
+    def frame(self, mask: np.ndarray) -> pd.DataFrame:
+        return pd.DataFrame({
+            'text': self.text[mask],
+            'fontname': self.fonts[self.font_id[mask]],
+            'size': self.size[mask],
+            'x0': self.x0[mask],
+            'x1': self.x1[mask],
+            'top': self.top[mask],
+            'bottom': self.bottom[mask],
+            'upright': self.upright[mask].astype(int)
+        }, index=np.flatnonzero(mask), columns=CharStore.columns)
+
+
+class FontProfile:
+
+    '''
+    usage:
+        document level main fontnames and sizes per language, counted over the chars of sample pages
+
+    note:
+        - a page uses the profile when the profile fonts (sizes) are present on it and the page is sparse (at most
+          sparse_chars chars, e.g. a few headings and a body line whose modal font is the heading font) or the profile
+          covers at least min_share of its chars; the per-page mode is then never computed
+        - a dense page mostly set in other fonts (sizes), or a page without them, clearly deviates and falls back to
+          its own modal font (size), so its body is never taken as feature text
+    '''
+
+    langs = [None, 'en', 'cn']
+    sparse_chars = 500
+    min_share = 0.5
+
+    def __init__(self, fontnames: dict, sizes: dict):
+        self.fontnames = fontnames
+        self.sizes = sizes
+
+    @classmethod
+    def from_char_stores(cls, char_stores: list):
+        fontnames, sizes = {}, {}
+        for lang in cls.langs:
+            font_counts = Counter()
+            for char_store in char_stores:
+                counts = np.bincount(char_store.font_id[char_store.mask(lang)], minlength=len(char_store.fonts))
+                font_counts.update({fontname: int(count) for fontname, count in zip(char_store.fonts, counts) if count})
+            fontnames[lang] = cls.modes(font_counts)
+            size_counts = Counter()
+            for char_store in char_stores:
+                mask = char_store.mask(lang) & char_store.font_mask(fontnames[lang])
+                values, counts = np.unique(char_store.size[mask], return_counts=True)
+                size_counts.update(dict(zip(values.tolist(), counts.tolist())))
+            sizes[lang] = cls.modes(size_counts)
+        return cls(fontnames, sizes)
+
+    @staticmethod
+    def modes(counts: Counter) -> list:
+        if not counts:
+            return []
+        max_count = max(counts.values())
+        return sorted(value for value, count in counts.items() if count == max_count)
+
+    def fits(self, is_profile: np.ndarray) -> bool:
+        '''
+        whether the profile applies to a page whose masked chars are flagged by is_profile
+        '''
+        if not is_profile.any():
+            return False
+        return len(is_profile) <= self.sparse_chars or is_profile.mean() >= self.min_share
+
+    def main_fontname(self, char_store: CharStore, mask: np.ndarray, lang=None) -> Union[pd.Series, None]:
+        '''
+        profile fontnames of lang if they fit the masked chars of the page, otherwise None
+        '''
+        fontnames = self.fontnames.get(lang)
+        if fontnames and self.fits(char_store.font_mask(fontnames)[mask]):
+            return pd.Series(fontnames, dtype=object)
+        return None
+
+    def main_fontsize(self, char_store: CharStore, mask: np.ndarray, lang=None) -> Union[pd.Series, None]:
+        '''
+        profile sizes of lang if they fit the masked (main font) chars of the page, otherwise None
+        '''
+        sizes = self.sizes.get(lang)
+        if sizes and self.fits(char_store.size_mask(sizes)[mask]):
+            return pd.Series(sizes, dtype=np.float32)
+        return None
+
+    def __repr__(self):
+        return f'<{self.__class__.__name__} {self.fontnames.get(None)} {self.sizes.get(None)}>'
@@ -8,18 +8,20 @@ import pandas as pd
 class CorporateGovReport(ReportOutline):
 
     title_regex = r'^(?=.*report).*corporate governance.*$'
+    prefilter_regex = r'corporategovernance'
 
     def __init__(self, outline):
         super().__init__(outline)
 
     @property
     def audit_fee(self):
-        return AuditFee.retrieve(self.pages)
+        return AuditFee.retrieve(self.pages, self.outline)
 
 
 class AuditFee(PageWithSection):
 
     section_regex = r"^(?!.*Nomination|.*Report)(?=.*REMUNERATION|.*independent|.*external|.*Accountability).*audit.*$"
+    prefilter_regex = r'audit'
 
     def __init__(self, pages):
         super().__init__(pages)
@@ -166,7 +168,7 @@ if __name__ == '__main__':
         # url, p = 'https://www1.hkexnews.hk/listedco/listconews/sehk/2020/0721/2020072100653.pdf', 94
         print(url)
         pdf = PDF.create(url)
-        corp_gov_report = pdf.get_outline(CorporateGovReport.title_regex)
+        corp_gov_report = pdf.get_outline(CorporateGovReport.title_regex, CorporateGovReport.prefilter_regex)
         if not corp_gov_report:
             continue
         corp_gov_report = CorporateGovReport.create(corp_gov_report[0])
@@ -1,6 +1,7 @@
 from bs4 import BeautifulSoup as bs
 from typing import Union
-import requests, re, pandas as pd
+import re, logging, pandas as pd
+from http_client import HttpClient
 
 class WikiPage:
     def __init__(self, url):
@@ -14,7 +15,7 @@ class WikiPage:
     def url(self, url):
         if not self.is_url(url):
             raise ValueError(f'{url} is not url')
-        with requests.get(url) as response:
+        with HttpClient.get(url) as response:
             response.raise_for_status()
             self._soup = bs(response.content, 'html.parser')
         self._url = url
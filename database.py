@@ -1,14 +1,16 @@
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
-from sqlalchemy import create_engine, Column, ForeignKey, inspect, desc, func
+from sqlalchemy import create_engine, Column, ForeignKey, Index, inspect, desc, func, text, bindparam
 from sqlalchemy.types import Integer, String, DateTime, Text, LargeBinary
 from sqlalchemy.ext.hybrid import hybrid_property, hybrid_method
-from datetime import datetime
-from contextlib import contextmanager
-from helper import flatten
+from sqlalchemy.exc import OperationalError
+from datetime import datetime, date
+from contextlib import contextmanager, nullcontext
+from helper import flatten, chunked
+from auditor_resolver import AuditorResolver
 import pandas as pd
-import random
-from typing import Union
+import random, re
+from typing import Union, NamedTuple
 # from logger import Logger
 
 name = 'foo2'
@@ -45,8 +47,8 @@ class AnnualReport(Base):
 class Auditor(Base):
     __tablename__ = 'auditor'
     id = Column(Integer, primary_key=True)
-    news_id = Column(Integer, ForeignKey('annual_report.news_id'))
-    name = Column(Text, nullable=False)
+    news_id = Column(Integer, ForeignKey('annual_report.news_id'), index=True)
+    name = Column(Text, nullable=False, index=True)
 
     def __repr__(self):
         return f"<{self.__class__.__name__}({self.id}, {self.news_id}, {self.name})>"
@@ -55,7 +57,7 @@ class Auditor(Base):
 class KeyAuditMatter(Base):
     __tablename__ = 'key_audit_matter'
     id = Column(Integer, primary_key=True)
-    news_id = Column(Integer, ForeignKey('annual_report.news_id'))
+    news_id = Column(Integer, ForeignKey('annual_report.news_id'), index=True)
     item = Column(Text)
     tags = relationship('KeyAuditMatterTag', backref='kam_item')
 
@@ -65,9 +67,10 @@ class KeyAuditMatter(Base):
 
 class KeyAuditMatterTag(Base):
     __tablename__ = 'key_audit_matter_tag'
+    __table_args__ = (Index('ix_key_audit_matter_tag_tag_news_id', 'tag', 'news_id'),)
     id = Column(Integer, primary_key=True)
-    news_id = Column(Integer, ForeignKey('annual_report.news_id'))
-    kam_id = Column(Integer, ForeignKey('key_audit_matter.id'))
+    news_id = Column(Integer, ForeignKey('annual_report.news_id'), index=True)
+    kam_id = Column(Integer, ForeignKey('key_audit_matter.id'), index=True)
     tag = Column(String)
 
     def __repr__(self):
@@ -92,6 +95,18 @@ class ValidatedAuditor(Base):
         return f'<{self.__class__.__name__}({self.id}, {self.name})>'
 
 
+class AuditorAlias(Base):
+    __tablename__ = 'auditor_alias'
+    id = Column(Integer, primary_key=True)
+    raw_name = Column(Text, nullable=False, unique=True)
+    validated_auditor_id = Column(Integer, ForeignKey('validated_auditor.id'), nullable=True, index=True) # None: no validated auditor matched
+    score = Column(Integer)
+    validated_auditor = relationship('ValidatedAuditor', backref='aliases')
+
+    def __repr__(self):
+        return f'<{self.__class__.__name__}({self.id}, {self.raw_name}, {self.validated_auditor_id}, {self.score})>'
+
+
 class CommonCurrency(Base):
     __tablename__ = 'common_currency'
     id = Column(Integer, primary_key=True)
@@ -103,11 +118,79 @@ class CommonCurrency(Base):
         return f'<{self.__class__.__name__}({self.id}, {self.code}, {self.symbol}, {self.symbol_native})>'
 
 
+class SchemaVersion(Base):
+    __tablename__ = 'schema_version'
+    version = Column(Integer, primary_key=True)
+    name = Column(String, nullable=False)
+    applied_on = Column(DateTime, default=datetime.now)
+
+    def __repr__(self):
+        return f'<{self.__class__.__name__}({self.version}, {self.name}, {self.applied_on})>'
+
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    statements: list
+    optional: bool = False # recorded as skipped instead of failing when sqlite rejects it (e.g. no fts5 module)
+
+
 class DataBase:
     INIT_KAM_KEYWORDS_CSV = 'kam_keywords.csv'
     INIT_CURRENCY_JSON = 'Common-Currency.json'
     INIT_VALID_AUDITORS = 'valid_auditors.csv'
 
+    # full text index of kam items with the title and long_text of their annual report, rowid is key_audit_matter.id
+    KAM_FTS_DDL = [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS kam_fts USING fts5(item, title, long_text, news_id UNINDEXED, tokenize='porter unicode61')",
+        """CREATE TRIGGER IF NOT EXISTS kam_fts_kam_insert AFTER INSERT ON key_audit_matter BEGIN
+            INSERT INTO kam_fts (rowid, item, title, long_text, news_id)
+            SELECT new.id, new.item, annual_report.title, annual_report.long_text, new.news_id
+            FROM (SELECT 1) LEFT JOIN annual_report ON annual_report.news_id = new.news_id;
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS kam_fts_kam_delete AFTER DELETE ON key_audit_matter BEGIN
+            DELETE FROM kam_fts WHERE rowid = old.id;
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS kam_fts_kam_update AFTER UPDATE OF id, news_id, item ON key_audit_matter BEGIN
+            DELETE FROM kam_fts WHERE rowid = old.id;
+            INSERT INTO kam_fts (rowid, item, title, long_text, news_id)
+            SELECT new.id, new.item, annual_report.title, annual_report.long_text, new.news_id
+            FROM (SELECT 1) LEFT JOIN annual_report ON annual_report.news_id = new.news_id;
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS kam_fts_report_insert AFTER INSERT ON annual_report BEGIN
+            UPDATE kam_fts SET title = new.title, long_text = new.long_text
+            WHERE rowid IN (SELECT id FROM key_audit_matter WHERE news_id = new.news_id);
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS kam_fts_report_update AFTER UPDATE OF title, long_text ON annual_report BEGIN
+            UPDATE kam_fts SET title = new.title, long_text = new.long_text
+            WHERE rowid IN (SELECT id FROM key_audit_matter WHERE news_id = new.news_id);
+        END""",
+    ]
+    KAM_FTS_REBUILD = [
+        "DELETE FROM kam_fts",
+        """INSERT INTO kam_fts (rowid, item, title, long_text, news_id)
+        SELECT key_audit_matter.id, key_audit_matter.item, annual_report.title, annual_report.long_text, key_audit_matter.news_id
+        FROM key_audit_matter LEFT JOIN annual_report ON annual_report.news_id = key_audit_matter.news_id""",
+    ]
+    # schema changes of existing dbs, applied in version order by DataBase.migrate; append new ones, never edit applied ones
+    MIGRATIONS = [
+        Migration(1, 'index foreign keys, auditor names and kam tags', [
+            'CREATE INDEX IF NOT EXISTS ix_auditor_news_id ON auditor (news_id)',
+            'CREATE INDEX IF NOT EXISTS ix_auditor_name ON auditor (name)',
+            'CREATE INDEX IF NOT EXISTS ix_auditor_lower_name ON auditor (lower(name))',
+            'CREATE INDEX IF NOT EXISTS ix_key_audit_matter_news_id ON key_audit_matter (news_id)',
+            'CREATE INDEX IF NOT EXISTS ix_key_audit_matter_tag_news_id ON key_audit_matter_tag (news_id)',
+            'CREATE INDEX IF NOT EXISTS ix_key_audit_matter_tag_kam_id ON key_audit_matter_tag (kam_id)',
+            'CREATE INDEX IF NOT EXISTS ix_key_audit_matter_tag_tag_news_id ON key_audit_matter_tag (tag, news_id)',
+            'CREATE INDEX IF NOT EXISTS ix_auditor_alias_validated_auditor_id ON auditor_alias (validated_auditor_id)',
+        ]),
+        Migration(2, 'kam full text index', KAM_FTS_DDL + KAM_FTS_REBUILD, optional=True),
+    ]
+    # annual_report.date_time is stored as dd/mm/yyyy hh:mm
+    SQL_REPORT_DATE = "substr(annual_report.date_time, 7, 4) || substr(annual_report.date_time, 4, 2) || substr(annual_report.date_time, 1, 2)"
+
+    _auditor_resolvers = {}
+
     def __init__(self, path=path):
         self.path = path
 
@@ -118,7 +201,10 @@ class DataBase:
         cls.init_kam_keywords(engine)
         cls.init_currencies(engine)
         cls.init_valid_auditors(engine)
-        return cls(path=path)
+        cls._auditor_resolvers.pop(path, None)
+        db = cls(path=path)
+        db.migrate()
+        return db
 
     @property
     def path(self):
@@ -182,6 +268,109 @@ class DataBase:
         except Exception as e:
             print(e)
 
+    @property
+    def schema_version(self) -> int:
+        with self.engine.connect() as con:
+            return con.execute(text('SELECT max(version) FROM schema_version')).scalar() or 0
+
+    def migrate(self, Base=Base) -> list:
+        '''
+        bring the schema of the db up to date: create missing tables, then apply MIGRATIONS newer than its schema
+        version, each in its own transaction together with its schema_version row
+        an optional migration failing with OperationalError is rolled back and recorded as skipped
+        '''
+        Base.metadata.create_all(self.engine)
+        current_version = self.schema_version
+        applied = []
+        for migration in sorted(self.MIGRATIONS, key=lambda migration: migration.version):
+            if migration.version <= current_version:
+                continue
+            try:
+                self.apply_migration(migration)
+            except OperationalError as e:
+                if not migration.optional:
+                    raise
+                self.apply_migration(migration._replace(name=f'{migration.name} (skipped: {e.orig})', statements=[]))
+                print(f'schema migration {migration.version} skipped: {migration.name}, {e.orig}')
+                continue
+            applied.append(migration)
+            print(f'schema migrated to version {migration.version}: {migration.name}')
+        return applied
+
+    def apply_migration(self, migration: Migration):
+        with self.engine.begin() as con:
+            con.execute(text('BEGIN')) # pysqlite runs DDL in autocommit mode unless a transaction is open
+            for statement in migration.statements:
+                con.execute(text(statement))
+            con.execute(SchemaVersion.__table__.insert(), {'version': migration.version, 'name': migration.name, 'applied_on': datetime.now()})
+
+    @property
+    def has_kam_fts(self) -> bool:
+        with self.engine.connect() as con:
+            return con.execute(text("SELECT count(*) FROM sqlite_master WHERE name = 'kam_fts'")).scalar() > 0
+
+    def rebuild_kam_fts(self):
+        '''
+        create (if missing) and re-index the kam full text index, e.g. after rows were written with the triggers
+        missing or after migration 2 was skipped on a sqlite build without fts5
+        '''
+        with self.engine.begin() as con:
+            con.execute(text('BEGIN'))
+            for sql in self.KAM_FTS_DDL + self.KAM_FTS_REBUILD:
+                con.execute(text(sql))
+
+    @staticmethod
+    def yyyymmdd(dt: Union[str, date, datetime]) -> str:
+        return pd.Timestamp(dt).strftime('%Y%m%d')
+
+    def search_kams(self, query: str, auditors: Union[list, str] = None, from_date: Union[str, date, datetime] = None,
+                    to_date: Union[str, date, datetime] = None, limit: int = 100, raw: bool = False) -> pd.DataFrame:
+        '''
+        kams whose item or the title / long_text of their annual report contain every word of query (e.g. 'write-down',
+        "auditor's"), best matches first (bm25)
+        auditors: only reports audited by these auditors (case insensitive)
+        from_date, to_date: only reports released within these dates (inclusive)
+        raw: pass query to fts5 as is, for its operators (e.g. 'goodwill AND impairment', '"expected credit loss"')
+        note: without kam_fts (sqlite built without fts5) or without any word in query the words are matched with
+        LIKE, raw operators are ignored and rank is null
+        '''
+        words = re.findall(r'\w+', query)
+        if raw:
+            words = [word for word in words if word not in ('AND', 'OR', 'NOT', 'NEAR')]
+        fts = self.has_kam_fts and bool(words)
+        conditions, params = [], {'limit': limit}
+        if fts:
+            conditions.append('kam_fts MATCH :query')
+            params['query'] = query if raw else ' '.join(f'"{word}"' for word in words)
+        else:
+            for i, word in enumerate(words):
+                conditions.append(f'(key_audit_matter.item LIKE :word{i} OR annual_report.title LIKE :word{i} OR annual_report.long_text LIKE :word{i})')
+                params[f'word{i}'] = f'%{word}%'
+        if auditors:
+            auditors = auditors if type(auditors) is list else [auditors]
+            conditions.append('key_audit_matter.news_id IN (SELECT news_id FROM auditor WHERE lower(auditor.name) IN :auditors)')
+            params['auditors'] = [auditor.lower() for auditor in auditors]
+        if from_date is not None:
+            conditions.append(f'{self.SQL_REPORT_DATE} >= :from_date')
+            params['from_date'] = self.yyyymmdd(from_date)
+        if to_date is not None:
+            conditions.append(f'{self.SQL_REPORT_DATE} <= :to_date')
+            params['to_date'] = self.yyyymmdd(to_date)
+        stmt = text(f"""
+            SELECT key_audit_matter.id AS kam_id, key_audit_matter.news_id, annual_report.date_time, annual_report.stock_code,
+                annual_report.stock_name, annual_report.title, key_audit_matter.item, {'bm25(kam_fts)' if fts else 'NULL'} AS rank
+            FROM {'kam_fts JOIN key_audit_matter ON key_audit_matter.id = kam_fts.rowid' if fts else 'key_audit_matter'}
+            JOIN annual_report ON annual_report.news_id = key_audit_matter.news_id
+            WHERE {' AND '.join(conditions) or '1'}
+            ORDER BY {'rank' if fts else 'key_audit_matter.id DESC'}
+            LIMIT :limit
+        """)
+        if auditors:
+            stmt = stmt.bindparams(bindparam('auditors', expanding=True))
+        with self.engine.connect() as con:
+            result = con.execute(stmt, params)
+            return pd.DataFrame(result.fetchall(), columns=list(result.keys()))
+
     @property
     def tables(self) -> list:
         inspector = self.inspector
@@ -199,9 +388,146 @@ class DataBase:
     
     def all_news_ids(self, table = AnnualReport):
         with self.Session() as session:
-            q = session.query(table).filter(table.news_id)
-        return [i.news_id for i in q.all()]
+            q = session.query(table.news_id)
+        return [news_id for news_id, in q.all()]
+
+    def new_news_ids(self, candidates, chunk_size=500, table = AnnualReport) -> list:
+        '''
+        candidate news_ids not in table yet, in candidate order
+        note: looked up with chunked news_id IN (...) queries on the unique news_id index instead of loading all news_ids
+        '''
+        candidates = list(dict.fromkeys(int(news_id) for news_id in candidates))
+        seen = set()
+        with self.Session() as session:
+            for chunk in chunked(candidates, chunk_size):
+                seen.update(news_id for news_id, in session.query(table.news_id).filter(table.news_id.in_(chunk)))
+        return [news_id for news_id in candidates if news_id not in seen]
+
+
+    def iter_kams(self, chunk_size=500):
+        '''
+        stored key audit matters as chunks of (id, news_id, item) rows, paginated on id
+        '''
+        last_id = 0
+        while True:
+            with self.Session() as session:
+                rows = session.query(KeyAuditMatter.id, KeyAuditMatter.news_id, KeyAuditMatter.item).filter(
+                    KeyAuditMatter.id > last_id).order_by(KeyAuditMatter.id).limit(chunk_size).all()
+            if not rows:
+                return
+            yield rows
+            last_id = rows[-1].id
+
+    def retag_kams(self, tagger, chunk_size=500, progress=None) -> dict:
+        '''
+        re-derive key_audit_matter_tag rows from stored kam items
+        tagger: maps a list of items to a list of tag lists, e.g. audit_report.KeyAuditMatter.get_tags_many
+        progress: called with the running totals after each chunk
+        note: only added / removed tags are written, with bulk statements in one transaction per chunk
+        '''
+        stats = {'kams': 0, 'inserted': 0, 'deleted': 0}
+        for rows in self.iter_kams(chunk_size):
+            tags = tagger([row.item or '' for row in rows])
+            wanted = {(row.id, tag): row.news_id for row, row_tags in zip(rows, tags) for tag in row_tags}
+            with self.Session() as session:
+                existing = session.query(KeyAuditMatterTag.id, KeyAuditMatterTag.kam_id, KeyAuditMatterTag.tag).filter(
+                    KeyAuditMatterTag.kam_id.in_([row.id for row in rows])).all()
+                current = {}
+                for tag_id, kam_id, tag in existing:
+                    current.setdefault((kam_id, tag), []).append(tag_id)
+                deletes = [tag_id for key, tag_ids in current.items() for tag_id in (tag_ids[1:] if key in wanted else tag_ids)]
+                inserts = [{'news_id': news_id, 'kam_id': kam_id, 'tag': tag} for (kam_id, tag), news_id in wanted.items() if (kam_id, tag) not in current]
+                for ids in chunked(deletes, chunk_size):
+                    session.query(KeyAuditMatterTag).filter(KeyAuditMatterTag.id.in_(ids)).delete(synchronize_session=False)
+                if inserts:
+                    session.bulk_insert_mappings(KeyAuditMatterTag, inserts)
+            stats['kams'] += len(rows)
+            stats['inserted'] += len(inserts)
+            stats['deleted'] += len(deletes)
+            if progress:
+                progress(stats)
+        return stats
+
+    def sync_kam_keywords(self, csv=None) -> list:
+        '''
+        add keywords of the kam keywords csv that are not in key_audit_matter_keywords yet
+        '''
+        keywords = pd.read_csv(csv or self.INIT_KAM_KEYWORDS_CSV, names=['keyword']).keyword.dropna().drop_duplicates().to_list()
+        with self.Session() as session:
+            existing = {keyword for keyword, in session.query(KeyAuditMatterKeywords.keyword)}
+            new_keywords = [keyword for keyword in keywords if keyword not in existing]
+            session.bulk_insert_mappings(KeyAuditMatterKeywords, [{'keyword': keyword} for keyword in new_keywords])
+        return new_keywords
 
+    @property
+    def auditor_resolver(self) -> AuditorResolver:
+        '''
+        resolver of raw auditor names, shared by all DataBase instances of the same path
+        '''
+        if self.path not in DataBase._auditor_resolvers:
+            DataBase._auditor_resolvers[self.path] = AuditorResolver.create(self)
+        return DataBase._auditor_resolvers[self.path]
+
+    def add_auditor_aliases(self, raw_names: list = None, session=None) -> int:
+        '''
+        map raw auditor names without an alias yet to their validated auditor in auditor_alias
+        raw_names: None to backfill every auditor.name without an alias
+        session: add within this session instead of a new one
+        '''
+        with nullcontext(session) if session is not None else self.Session() as session:
+            if raw_names is None:
+                query = session.query(Auditor.name).distinct().outerjoin(
+                    AuditorAlias, AuditorAlias.raw_name == Auditor.name).filter(AuditorAlias.id.is_(None))
+                names = [name for name, in query]
+            else:
+                names = list(dict.fromkeys(name for name in raw_names if name))
+                existing = set()
+                for chunk in chunked(names, 500):
+                    existing.update(name for name, in session.query(AuditorAlias.raw_name).filter(AuditorAlias.raw_name.in_(chunk)))
+                names = [name for name in names if name not in existing]
+            if not names:
+                return 0
+            valid_ids = {name: id_ for id_, name in session.query(ValidatedAuditor.id, ValidatedAuditor.name)}
+            aliases = [
+                {'raw_name': name, 'validated_auditor_id': valid_ids.get(valid_auditor), 'score': similarity}
+                for name, (valid_auditor, similarity) in zip(names, self.auditor_resolver.match_many(names))
+            ]
+            session.execute(AuditorAlias.__table__.insert().prefix_with('OR IGNORE'), aliases)
+        return len(aliases)
+
+    def query_market_share(self, others='Others') -> pd.DataFrame:
+        '''
+        number of auditor rows per validated auditor (upper case), auditors without a validated auditor count as others
+        '''
+        auditor = func.coalesce(func.upper(ValidatedAuditor.name), others.upper()).label('auditors')
+        with self.Session() as session:
+            query = session.query(auditor, func.count(Auditor.id).label('count')).select_from(Auditor).outerjoin(
+                AuditorAlias, AuditorAlias.raw_name == Auditor.name).outerjoin(
+                ValidatedAuditor, ValidatedAuditor.id == AuditorAlias.validated_auditor_id).group_by(auditor).order_by(desc('count'))
+        results = query.all()
+        return pd.DataFrame(results, columns = ['auditors', 'count'])
+
+    def query_validated_auditors_with_reports(self, others='Others') -> list:
+        with self.Session() as session:
+            query = session.query(func.coalesce(func.upper(ValidatedAuditor.name), others.upper())).select_from(Auditor).join(
+                AuditorAlias, AuditorAlias.raw_name == Auditor.name).outerjoin(
+                ValidatedAuditor, ValidatedAuditor.id == AuditorAlias.validated_auditor_id).distinct()
+        return sorted(name for name, in query.all())
+
+    def query_annual_report_with_validated_auditor(self, validated_auditor: str = None):
+        '''
+        annual reports whose auditors map to validated_auditor (case insensitive) in auditor_alias, None for unmatched auditors
+        '''
+        with self.Session() as session:
+            query = session.query(AnnualReport).join(Auditor).join(AuditorAlias, AuditorAlias.raw_name == Auditor.name).outerjoin(
+                ValidatedAuditor, ValidatedAuditor.id == AuditorAlias.validated_auditor_id)
+            if validated_auditor is None:
+                query = query.filter(AuditorAlias.validated_auditor_id.is_(None))
+            else:
+                query = query.filter(func.lower(ValidatedAuditor.name) == validated_auditor.lower())
+        results = query.all()
+        print(f'{len(results)} annual report is produced by {validated_auditor}')
+        return self.query_to_df(results)
 
     def add(self, instance):
         with self.Session() as session:
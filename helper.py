@@ -1,4 +1,4 @@
-from itertools import groupby
+from itertools import groupby, islice
 from operator import itemgetter
 import re
 
@@ -23,4 +23,13 @@ def flatten(li: list) -> list:
     '''
     return sum(map(flatten, li), []) if isinstance(li, list) else [li]
 
-
+def chunked(iterable, size: int):
+    '''
+    yield lists of at most size items from iterable
+    '''
+    it = iter(iterable)
+    while True:
+        chunk = list(islice(it, size))
+        if not chunk:
+            return
+        yield chunk
@@ -1,7 +1,26 @@
-import json, requests, datetime, html, logging
-from typing import Generator
-from collections import namedtuple
+import json, datetime, html, logging
+from typing import Generator, NamedTuple, Optional
+from concurrent.futures import ThreadPoolExecutor
 from logger import Logger
+from http_client import HttpClient
+
+
+class Filing(NamedTuple):
+    '''
+    one row of hkex title search result
+    '''
+    news_id: int
+    date_time: str
+    released_at: Optional[datetime.datetime]
+    stock_code: str
+    stock_name: str
+    title: str
+    short_text: str
+    long_text: str
+    file_type: str
+    file_info: str
+    file_link: str
+
 
 class HKEX_API(Logger):
     
@@ -17,11 +36,14 @@ class HKEX_API(Logger):
     
     endpoint = 'https://www1.hkexnews.hk/search/titleSearchServlet.do'
     dt_fmt = '%Y%m%d'
+    release_dt_fmt = '%d/%m/%Y %H:%M'
     doc_code = {
         'annual_report': '40100',
         'half_year_report': '40200',
         'quaterly_report': '40300'    
     }
+    shard_days = 90
+    max_workers = 8
 
     
     def __init__(self, from_date=None, to_date=None, stock_id=None, doc='annual_report'):
@@ -98,9 +120,25 @@ class HKEX_API(Logger):
 
     @staticmethod
     def data_decoder(data):
-        data = {k.lower(): html.unescape(v) for k, v in data.items()}
-        data['file_link'] = "https://www1.hkexnews.hk" + data['file_link']
-        return namedtuple('data', data.keys())(*data.values())
+        get = lambda key: html.unescape(data.get(key) or '')
+        date_time = get('DATE_TIME')
+        try:
+            released_at = datetime.datetime.strptime(date_time, HKEX_API.release_dt_fmt)
+        except ValueError:
+            released_at = None
+        return Filing(
+            news_id=int(data['NEWS_ID']),
+            date_time=date_time,
+            released_at=released_at,
+            stock_code=get('STOCK_CODE'),
+            stock_name=get('STOCK_NAME'),
+            title=get('TITLE'),
+            short_text=get('SHORT_TEXT'),
+            long_text=get('LONG_TEXT'),
+            file_type=get('FILE_TYPE'),
+            file_info=get('FILE_INFO'),
+            file_link="https://www1.hkexnews.hk" + get('FILE_LINK')
+        )
     
     
     @staticmethod
@@ -115,15 +153,32 @@ class HKEX_API(Logger):
 
     @staticmethod
     def call_api(endpoint:str, payloads:dict) -> tuple:
-               
-        with requests.get(endpoint, params=payloads) as response:
+        return tuple(HKEX_API.iter_api(endpoint, payloads=payloads))
+
+    @staticmethod
+    def iter_api(endpoint:str, payloads:dict) -> Generator:
+        for page in HKEX_API.iter_api_pages(endpoint, payloads=payloads):
+            yield from page
+
+    @staticmethod
+    def iter_api_pages(endpoint:str, payloads:dict) -> Generator:
+        '''
+        yield the first page of results as soon as it arrives,
+        then the rows beyond it when the query has next rows
+        '''
+        with HttpClient.get(endpoint, params=payloads) as response:
             response.raise_for_status()
             site_json = json.loads(response.text)
-            if site_json['hasNextRow']:
-                payloads['rowRange'] = site_json['recordCnt']
-                return HKEX_API.call_api(endpoint, payloads=payloads)
-            results = json.loads(site_json['result'], object_hook = HKEX_API.data_decoder)
-            return tuple(results)
+        results = json.loads(site_json['result'] or '[]', object_hook = HKEX_API.data_decoder)
+        yield results
+        if site_json['hasNextRow']:
+            payloads = {**payloads, 'rowRange': site_json['recordCnt']}
+            with HttpClient.get(endpoint, params=payloads) as response:
+                response.raise_for_status()
+                site_json = json.loads(response.text)
+            yielded = {row.news_id for row in results}
+            rest = json.loads(site_json['result'] or '[]', object_hook = HKEX_API.data_decoder)
+            yield [row for row in rest if row.news_id not in yielded]
     
 
     @staticmethod
@@ -165,11 +220,73 @@ class HKEX_API(Logger):
         finally:
             return dt_yearsago.strftime(HKEX_API.dt_fmt)
     
+    @staticmethod
+    def date_windows(from_date:str, to_date:str, days:int) -> list:
+        '''
+        split from_date to to_date into consecutive windows of at most n days,
+        latest window first, in HKEX_API.dt_fmt format
+        '''
+        dt_from = datetime.datetime.strptime(from_date, HKEX_API.dt_fmt)
+        dt_to = datetime.datetime.strptime(to_date, HKEX_API.dt_fmt)
+        windows = []
+        while dt_to >= dt_from:
+            dt_start = max(dt_from, dt_to - datetime.timedelta(days=days - 1))
+            windows.append((dt_start.strftime(HKEX_API.dt_fmt), dt_to.strftime(HKEX_API.dt_fmt)))
+            dt_to = dt_start - datetime.timedelta(days=1)
+        return windows
+
+    def shards(self, stock_ids:list=None, days:int=None) -> list:
+        '''
+        split the query into sub queries which each satisfy the payloads constraint:
+            - with stock_ids, one query per stock id over the whole range (stock queries have no date limit)
+            - without stock_ids, one global query per window of days (windows must be within a year)
+        '''
+        stock_ids = stock_ids or ([self.stock_id] if self.stock_id else None)
+        if stock_ids:
+            return [HKEX_API(from_date=self.from_date, to_date=self.to_date, stock_id=stock_id, doc=self.doc) for stock_id in stock_ids]
+        windows = HKEX_API.date_windows(self.from_date, self.to_date, days or HKEX_API.shard_days)
+        return [HKEX_API(from_date=from_date, to_date=to_date, doc=self.doc) for from_date, to_date in windows]
+
     @Logger.track
     def get_data(self) -> list:
         data = HKEX_API.call_api(endpoint=HKEX_API.endpoint, payloads=self.payloads)
         self.logger.info(f'{len(data)} row of data from {self.from_date} to {self.to_date}')
         return data
+
+    def iter_data(self, stock_ids:list=None, days:int=None) -> Generator:
+        '''
+        stream rows shard by shard (latest window first) so processing can
+        start before the whole range has been fetched
+        '''
+        for page in self.iter_pages(stock_ids=stock_ids, days=days):
+            yield from page
+
+    def iter_pages(self, stock_ids:list=None, days:int=None) -> Generator:
+        '''
+        iter_data as the lists of rows of each listing page, in arrival order
+        '''
+        for shard in self.shards(stock_ids=stock_ids, days=days):
+            yield from HKEX_API.iter_api_pages(endpoint=HKEX_API.endpoint, payloads=shard.payloads)
+
+    @Logger.track
+    def get_sharded_data(self, stock_ids:list=None, days:int=None, max_workers:int=None) -> tuple:
+        '''
+        fetch the query range (and stock ids) as concurrent sub queries,
+        merged in shard order and deduplicated by news_id
+        '''
+        shards = self.shards(stock_ids=stock_ids, days=days)
+        payloads = [shard.payloads for shard in shards]
+        max_workers = min(max_workers or HKEX_API.max_workers, len(payloads)) or 1
+        self.logger.info(f'{len(payloads)} shards from {self.from_date} to {self.to_date} with {max_workers} workers')
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = executor.map(lambda payload: HKEX_API.call_api(endpoint=HKEX_API.endpoint, payloads=payload), payloads)
+            data = {}
+            for result in results:
+                for row in result:
+                    data.setdefault(row.news_id, row)
+        data = tuple(data.values())
+        self.logger.info(f'{len(data)} row of data from {self.from_date} to {self.to_date}')
+        return data
     
     def __repr__(self):
         return f'{self.__class__.__name__}'
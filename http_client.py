@@ -0,0 +1,66 @@
+import os, threading, requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from logger import Logger
+
+class HttpClient(Logger):
+
+    '''
+    usage:
+        process-wide keep-alive http session shared by hkex api queries, pdf downloads and wiki scraping
+
+    note:
+        - HttpClient.get(url, **kwargs) has the same signature as requests.get
+        - call HttpClient.configure(pool_size=..., timeout=..., retries=..., backoff_factor=...) before the first request to tune it
+        - the session is rebuilt after fork so worker processes never share sockets with the parent
+    '''
+
+    pool_size = 16
+    timeout = (10, 120) # (connect, read) seconds
+    retries = 3
+    backoff_factor = 0.5
+    status_forcelist = (429, 500, 502, 503, 504)
+
+    _session = None
+    _pid = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def configure(cls, pool_size=None, timeout=None, retries=None, backoff_factor=None):
+        cls.pool_size = pool_size or cls.pool_size
+        cls.timeout = timeout or cls.timeout
+        cls.retries = cls.retries if retries is None else retries
+        cls.backoff_factor = cls.backoff_factor if backoff_factor is None else backoff_factor
+        with cls._lock:
+            cls._session = None
+        cls.get_module_logger().info(f'{cls.__name__} configured with pool_size={cls.pool_size}, timeout={cls.timeout}, retries={cls.retries}')
+
+    @classmethod
+    def session(cls) -> requests.Session:
+        with cls._lock:
+            if cls._session is None or cls._pid != os.getpid():
+                cls._session = cls.new_session()
+                cls._pid = os.getpid()
+            return cls._session
+
+    @classmethod
+    def new_session(cls) -> requests.Session:
+        retry = Retry(
+            total=cls.retries,
+            backoff_factor=cls.backoff_factor,
+            status_forcelist=cls.status_forcelist
+        )
+        adapter = HTTPAdapter(pool_connections=cls.pool_size, pool_maxsize=cls.pool_size, max_retries=retry)
+        session = requests.Session()
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
+    @classmethod
+    def get(cls, url, **kwargs) -> requests.Response:
+        kwargs.setdefault('timeout', cls.timeout)
+        return cls.session().get(url, **kwargs)
+
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,195 @@
+import re, time, threading
+from typing import Iterable
+from sqlalchemy import func
+from logger import Logger
+import database as DB
+
+class KeywordMatcher:
+
+    '''
+    usage:
+        find every keyword in a text in one pass, same result as a case insensitive re.search per keyword
+
+    note:
+        - ascii literal keywords are compiled into one trie shaped regex inside a lookahead and run over the
+          lowercased text, so a single scan reports the longest keyword starting at each position; shorter keywords
+          contained in a match (e.g. "value" in "values", "asset" in "financial asset") are implied by it
+        - lowercasing equals re.IGNORECASE only for ascii text ("İ".lower() is two characters, "ı" and "ſ" match
+          "i" and "s"), so non ascii strings are scanned with the same trie compiled with re.IGNORECASE
+        - keywords with regex syntax or non ascii characters are searched one by one with re.IGNORECASE
+        - KeywordMatcher.tag_many(strings) tags a whole column in one scan over the joined strings
+    '''
+
+    metachars = set('.^$*+?{}[]\\|()\n')
+    separator = '\n'
+
+    def __init__(self, keywords: Iterable[str]):
+        self.keywords = list(dict.fromkeys(keyword for keyword in keywords if keyword))
+        literals = [keyword for keyword in self.keywords if keyword.isascii() and not self.metachars & set(keyword)]
+        self.patterns = [re.compile(keyword, re.IGNORECASE) for keyword in self.keywords if keyword not in literals]
+        self.implied = {
+            literal.lower(): sorted({keyword for keyword in literals if keyword.lower() in literal.lower()})
+            for literal in literals
+        }
+        self.regex = re.compile(f'(?=({self.trie_pattern(self.implied)}))') if literals else None
+        self.regex_i = re.compile(self.regex.pattern, re.IGNORECASE) if literals else None
+        self.any_regex = re.compile('|'.join(f'(?:{keyword})' for keyword in self.keywords), re.IGNORECASE)
+
+    @staticmethod
+    def trie_pattern(words: Iterable[str]) -> str:
+        '''
+        regex alternation of words factored by common prefixes, longer words are tried first
+        '''
+        root = {}
+        for word in words:
+            node = root
+            for char in word:
+                node = node.setdefault(char, {})
+            node[''] = {}
+
+        def pattern(node):
+            branches = [re.escape(char) + pattern(child) for char, child in sorted(node.items()) if char]
+            if not branches:
+                return ''
+            branch = branches[0] if len(branches) == 1 else f'(?:{"|".join(branches)})'
+            return f'(?:{branch})?' if '' in node else branch
+
+        return pattern(root)
+
+    def implied_by(self, match: str) -> list:
+        '''
+        keywords implied by a match of regex_i, whose text may not lowercase to the literal (e.g. "İmpairment")
+        '''
+        if match.lower() in self.implied:
+            return self.implied[match.lower()]
+        return next(keywords for literal, keywords in self.implied.items()
+                    if re.fullmatch(re.escape(literal), match, re.IGNORECASE))
+
+    def find(self, string: str) -> set:
+        '''
+        set of keywords found in string
+        '''
+        found = set()
+        if self.regex is not None:
+            if string.isascii():
+                for m in self.regex.finditer(string.lower()):
+                    found.update(self.implied[m.group(1)])
+            else:
+                for m in self.regex_i.finditer(string):
+                    found.update(self.implied_by(m.group(1)))
+        found.update(pattern.pattern for pattern in self.patterns if pattern.search(string))
+        return found
+
+    def tags(self, string: str) -> list:
+        return sorted(self.find(string))
+
+    def tag_many(self, strings: Iterable[str]) -> list:
+        '''
+        sorted keywords of each string, literal keywords are found in one scan over all ascii strings
+        '''
+        strings = ['' if string is None else str(string) for string in strings]
+        found = [set() for _ in strings]
+        if self.regex is not None and strings:
+            rows = [row for row, string in enumerate(strings) if string.isascii()]
+            lowered = [strings[row].lower() for row in rows]
+            ends, end = [], -1
+            for string in lowered:
+                end += len(string) + len(self.separator)
+                ends.append(end)
+            i = 0
+            for m in self.regex.finditer(self.separator.join(lowered)):
+                while m.start() > ends[i]:
+                    i += 1
+                found[rows[i]].update(self.implied[m.group(1)])
+            for row, string in enumerate(strings):
+                if not string.isascii():
+                    for m in self.regex_i.finditer(string):
+                        found[row].update(self.implied_by(m.group(1)))
+        for pattern in self.patterns:
+            for tags, string in zip(found, strings):
+                if pattern.search(string):
+                    tags.add(pattern.pattern)
+        return [sorted(tags) for tags in found]
+
+    def any(self, strings: Iterable[str]) -> list:
+        '''
+        sorted keywords found in any of strings
+        '''
+        return sorted(set().union(*self.tag_many(strings)))
+
+    def __len__(self):
+        return len(self.keywords)
+
+    def __repr__(self):
+        return f'<{self.__class__.__name__} {len(self.implied)} literal, {len(self.patterns)} regex keywords>'
+
+
+class KeywordRegistry(Logger):
+
+    '''
+    usage:
+        kam keywords of the key_audit_matter_keywords table and their compiled KeywordMatcher, loaded on first use
+
+    note:
+        - the table is not touched on import, so modules using the registry import fine before DataBase.init
+        - the matcher is cached in memory and rebuilt only when the table version (row count, max id, total keyword
+          length) changes; the version is checked at most once every ttl seconds
+        - one registry is shared by the threads of a process, forked workers inherit the compiled matcher
+    '''
+
+    ttl = 60
+
+    def __init__(self, path=None):
+        super().__init__()
+        self.path = path or DB.path
+        self._db = None
+        self._matcher = None
+        self._version = None
+        self._checked_on = None
+        self._lock = threading.Lock()
+
+    @property
+    def db(self) -> DB.DataBase:
+        if self._db is None:
+            self._db = DB.DataBase(self.path)
+        return self._db
+
+    @property
+    def version(self) -> tuple:
+        table = DB.KeyAuditMatterKeywords
+        with self.db.Session() as session:
+            return tuple(session.query(func.count(table.id), func.max(table.id), func.sum(func.length(table.keyword))).one())
+
+    def load(self) -> list:
+        table = DB.KeyAuditMatterKeywords
+        with self.db.Session() as session:
+            return [keyword for keyword, in session.query(table.keyword).order_by(table.id)]
+
+    @property
+    def matcher(self) -> KeywordMatcher:
+        with self._lock:
+            now = time.monotonic()
+            if self._matcher is None or now - self._checked_on > self.ttl:
+                version = self.version
+                if self._matcher is None or version != self._version:
+                    self._matcher = KeywordMatcher(self.load())
+                    self._version = version
+                    self.logger.info(f'Loaded {len(self._matcher)} kam keywords, version {version}')
+                self._checked_on = now
+            return self._matcher
+
+    @property
+    def keywords(self) -> list:
+        return self.matcher.keywords
+
+    def reload(self) -> KeywordMatcher:
+        with self._lock:
+            self._matcher = None
+        return self.matcher
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}(path="{self.path}")'
+
+
+if __name__ == '__main__':
+    pass
@@ -1,16 +1,22 @@
 from annual_report import AnnualReport
+from audit_report import KeyAuditMatter
+from auditor_resolver import AuditorResolver
 from hkex_api import HKEX_API
 import database as DB
 from logger import Logger
-import re, os
-from fuzzywuzzy import process, fuzz
+from helper import chunked
+import os, time
 
 
 class Worker(Logger):
 
-    def __init__(self, query=HKEX_API(), verbose=True):
+    new_news_id_chunk_size = 500
+
+    def __init__(self, query=HKEX_API(), verbose=True, stream=False):
         super().__init__()
         self.db = DB.DataBase()
+        self.db.migrate()
+        self.stream = stream
         self.query = query
         if verbose:
             super().show_stream_log()
@@ -26,6 +32,10 @@ class Worker(Logger):
         news_ids = self.db.all_news_ids(table)
         return news_ids
 
+    @property
+    def auditor_resolver(self) -> AuditorResolver:
+        return self.db.auditor_resolver
+
     @property
     def query(self):
         return self._query
@@ -33,21 +43,37 @@ class Worker(Logger):
     @query.setter
     def query(self, query):
         self._query = query
-        self._datas = self._query.get_data()
-        all_news_ids = self.all_news_ids
-        self._datas = [data for data in self._datas if int(
-            data.news_id) not in all_news_ids]
+        if self.stream:
+            self._datas = self.new_datas(self._query.iter_pages())
+            self.logger.info(f'Streaming new data since last run.')
+            return
+        self._datas = list(self.new_datas(chunked(self._query.get_data(), self.new_news_id_chunk_size)))
         self.logger.info(
             f'{len(self._datas)} rows of new data since last run.')
 
+    def new_datas(self, chunks):
+        '''
+        datas whose news_id is not in db yet, each chunk (a listing page when streaming) checked against db as it arrives
+        '''
+        for chunk in chunks:
+            new_news_ids = set(self.db.new_news_ids([data.news_id for data in chunk]))
+            for data in chunk:
+                if data.news_id in new_news_ids:
+                    new_news_ids.discard(data.news_id)
+                    yield data
+
     @property
     def datas(self):
         return self._datas
 
     @Logger.track
-    def start(self):
+    def start(self, batch_size=1):
+        '''
+        batch_size: number of annual reports written to db per transaction
+        '''
         datas = self.datas
-        for data in datas:
+        batch = []
+        for i, data in enumerate(datas, 1):
             self.logger.info(f'Start processing {data}')
 
             annual_report = AnnualReport.create(
@@ -62,22 +88,65 @@ class Worker(Logger):
             )
 
             if annual_report:
-                try:
-                    annual_report.add_to_db()
-                except Exception as e:
-                    self.logger.error(e)
-                    continue
+                batch.append(annual_report)
+            if len(batch) >= batch_size:
+                self.add_to_db(batch)
+                batch = []
             self.logger.info(f'Finish processing {data}')
+            if self.stream:
+                self.logger.info(f'{i} processed.')
+                continue
+            self.logger.info(
+                f'{i/len(datas):.2%} complete. {len(datas) - i} remains.')
+        if batch:
+            self.add_to_db(batch)
+
+    def add_to_db(self, annual_reports: list):
+        '''
+        write annual_reports in one transaction; if it fails, retry them one by one so a bad report only loses itself
+        '''
+        try:
+            AnnualReport.add_all_to_db(annual_reports, db=self.db)
+        except Exception as e:
+            self.logger.error(e)
+            if len(annual_reports) > 1:
+                for annual_report in annual_reports:
+                    self.add_to_db([annual_report])
+
+    @Logger.track
+    def retag_kams(self, chunk_size=500, sync_keywords=True) -> dict:
+        '''
+        re-derive kam tags of all stored kams after a keyword change, without reprocessing any pdf
+        '''
+        if sync_keywords:
+            new_keywords = self.db.sync_kam_keywords()
+            self.logger.info(f'{len(new_keywords)} new kam keywords: {new_keywords}')
+        KeyAuditMatter.registry.reload()
+        start = time.perf_counter()
+
+        def progress(stats):
+            elapsed = time.perf_counter() - start
             self.logger.info(
-                f'{datas.index(data)/len(datas):.2%} complete. {len(datas) - (datas.index(data) + 1)} remains.')
+                f'{stats["kams"]} kams retagged in {elapsed:.1f}s ({stats["kams"] / elapsed:.0f} kams/s), '
+                f'{stats["inserted"]} tags inserted, {stats["deleted"]} tags deleted.')
+
+        return self.db.retag_kams(KeyAuditMatter.get_tags_many, chunk_size=chunk_size, progress=progress)
 
     def get_market_share(self, pct=False, alphabetical_order=False):
-        df_auditors = self.db.query_auditors()
-        df_auditors['auditors'] = df_auditors.auditors.apply(lambda auditor: self.validate_auditor(auditor, others = 'Others'))
-        df_market_share = (df_auditors.auditors.value_counts(normalize=True).mul(100).round(2).astype(str) + '%').rename_axis('auditors').to_frame('pct') if pct else \
-            df_auditors.auditors.value_counts().rename_axis('auditors').to_frame('count')
+        self.backfill_auditor_aliases()
+        df_market_share = self.db.query_market_share(others='Others').set_index('auditors')
+        df_market_share = (df_market_share['count'].div(df_market_share['count'].sum()).mul(100).round(2).astype(str) + '%').to_frame('pct') if pct else \
+            df_market_share[['count']]
         return df_market_share.sort_index() if alphabetical_order else df_market_share
 
+    def backfill_auditor_aliases(self) -> int:
+        '''
+        map stored auditor names without an alias yet, e.g. rows inserted before auditor_alias existed
+        '''
+        n_aliases = self.db.add_auditor_aliases()
+        self.logger.info(f'{n_aliases} auditor aliases backfilled.')
+        return n_aliases
+
     def kam_tags_to_csv(self, dir_='kam_tags'):
         df_kam_tags = self.db.query_kams_tags()
         kam_tags = df_kam_tags.tag.sort_values().unique().tolist()
@@ -93,36 +162,20 @@ class Worker(Logger):
             df_relative_annual_report.to_csv(csv_path, index=False)
 
     def auditors_to_csv(self, dir_='auditors'):
-        df_auditors = self.db.query_auditors()
-        auditors = df_auditors.auditors.sort_values().unique().tolist()
+        self.backfill_auditor_aliases()
+        auditors = self.db.query_validated_auditors_with_reports(others='Others')
         cols = ['id', 'news_id', 'date_time', 'stock_code', 'stock_name', 'title',
                 'long_text', 'file_info', 'audit_firms', 'kams', 'kam_tags', 'file_link']
         if not os.path.exists(dir_):
                 os.makedirs(dir_)
         for auditor in auditors:
-            df_relative_annual_report = self.db.query_annual_report_with_auditors(auditor, case_insensitive=False)
+            df_relative_annual_report = self.db.query_annual_report_with_validated_auditor(None if auditor == 'OTHERS' else auditor)
             df_relative_annual_report = df_relative_annual_report[cols]
-            auditor = self.validate_auditor(auditor, others='Others')
             csv_path = f'./{dir_}/{auditor.replace(" ", "_")}.csv'
-            
-            if not os.path.isfile(csv_path):
-                df_relative_annual_report.to_csv(csv_path, index=False)
-            else:
-                df_relative_annual_report.to_csv(csv_path, mode='a', header=False, index=False)
+            df_relative_annual_report.to_csv(csv_path, index=False)
 
     def validate_auditor(self, r_auditor, min_similarity=90, others = None):
-        v_auditors = self.db.query_valid_auditors().v_auditors.to_list()
-        _r_auditor = re.sub(r's*(limited|Touche Tohmatsu)','', r_auditor, flags=re.IGNORECASE)
-        valid_auditor = process.extractOne(
-            _r_auditor, v_auditors, scorer=fuzz.token_set_ratio)[0]
-        similarity = process.extractOne(
-            _r_auditor, v_auditors, scorer=fuzz.token_set_ratio)[1]
-        if len(_r_auditor) <= 4:
-            min_similarity = 80
-        if others:
-            return valid_auditor.upper() if similarity >= min_similarity else others.upper()
-        return valid_auditor.upper() if similarity >= min_similarity else _r_auditor
-    
+        return self.auditor_resolver.resolve(r_auditor, min_similarity=min_similarity, others=others)
 
 
 
@@ -1,11 +1,137 @@
 from io import BytesIO
 from typing import Union, Pattern, Match
-from itertools import zip_longest
+from itertools import zip_longest, islice
+from functools import wraps
+from collections.abc import Sequence
+from concurrent.futures import ProcessPoolExecutor
 from helper import flatten, utf8_str, consecutive_int_list
-import pandas as pd, requests, re, logging, os, pdfplumber, PyPDF2
+import pandas as pd, re, logging, os, pdfplumber, PyPDF2
 from logger import Logger
+from http_client import HttpClient
+from pdf_cache import PDFCache
+from char_store import CharStore, FontProfile
+
+def page_cache(func):
+    '''
+    memoize a Page property / method per df_lang and arguments until Page.page is replaced (e.g. cropped);
+    concurrent readers may compute a value twice but never see a partial one
+    '''
+    @wraps(func)
+    def cached(self, *args):
+        key = (func.__qualname__, self.df_lang, args)
+        try:
+            return self._cache[key]
+        except KeyError:
+            value = self._cache[key] = func(self, *args)
+            return value
+    return cached
+
+
+def raw_text(pb_page, pypdf_reader=None) -> str:
+    '''
+    text of a page with all whitespace removed and no layout analysis; taken from the content stream by
+    pypdf_reader when given (no pdfminer parse at all, but fonts with custom encodings come out as garbage),
+    otherwise from pdfplumber chars
+    '''
+    if pypdf_reader is not None:
+        try:
+            return re.sub(r'\s+', '', pypdf_reader.getPage(pb_page.page_number - 1).extractText())
+        except Exception:
+            return ''
+    return re.sub(r'\s+', '', ''.join(char['text'] for char in pb_page.chars))
+
+
+def passes_prefilter(pb_page, prefilter: Pattern = None, pypdf_reader=None) -> bool:
+    '''
+    cheap necessary condition before Page.create; prefilter is matched against raw_text,
+    so it must be written without whitespace e.g. r'keyauditmatter'
+    note: a match in the pypdf_reader text accepts the page at once, a miss is confirmed against the
+    pdfplumber chars before the page is rejected
+    '''
+    if not prefilter:
+        return True
+    if pypdf_reader is not None and re.search(prefilter, raw_text(pb_page, pypdf_reader), flags=re.IGNORECASE):
+        return True
+    return re.search(prefilter, raw_text(pb_page), flags=re.IGNORECASE) is not None
+
+
+def page_matches(pb_page, regex: Pattern, prefilter: Pattern = None, font_profile: FontProfile = None, pypdf_reader=None) -> bool:
+    '''
+    whether feature text of a pdfplumber page matches regex
+    '''
+    if not passes_prefilter(pb_page, prefilter, pypdf_reader):
+        return False
+    page = Page.create(pb_page, font_profile=font_profile)
+    if not page or page.df_feature_text.empty:
+        return False
+    return any(page.df_feature_text.text.str.contains(regex, flags=re.IGNORECASE))
+
+
+def scan_pages(path: str, page_nums: list, regex: Pattern, prefilter: Pattern = None, font_profile: FontProfile = None) -> list:
+    '''
+    process pool worker of PDF.search_outline: reopen the document by path and
+    return the page numbers whose feature text matches regex
+    '''
+    with pdfplumber.open(path) as pdf, open(path, 'rb') as f:
+        pypdf_reader = PyPDF2.PdfFileReader(f, strict=False) if prefilter else None
+        return [p for p in page_nums if page_matches(pdf.pages[p], regex, prefilter, font_profile, pypdf_reader)]
+
+
+def feature_text_rows(pb_page, font_profile: FontProfile = None) -> pd.DataFrame:
+    '''
+    feature text lines of a pdfplumber page with their page_num
+    '''
+    page = Page.create(pb_page, font_profile=font_profile)
+    if not page or page.df_feature_text.empty:
+        return pd.DataFrame(columns=PDF.heading_index_columns)
+    df = page.df_feature_text.assign(page_num=page.page_number)
+    return df[PDF.heading_index_columns]
+
+
+def index_pages(path: str, page_nums: list, font_profile: FontProfile = None, prefilter: Pattern = None) -> tuple:
+    '''
+    process pool worker of PDF.get_heading_index: reopen the document by path and
+    return (indexed page numbers, their feature text lines), skipping pages failing prefilter
+    '''
+    with pdfplumber.open(path) as pdf, open(path, 'rb') as f:
+        pypdf_reader = PyPDF2.PdfFileReader(f, strict=False) if prefilter else None
+        indexed = [p for p in page_nums if passes_prefilter(pdf.pages[p], prefilter, pypdf_reader)]
+        dfs = [feature_text_rows(pdf.pages[p], font_profile) for p in indexed]
+        return indexed, pd.concat(dfs, ignore_index=True) if dfs else pd.DataFrame(columns=PDF.heading_index_columns)
+
+
+class ScanProgress:
+    '''
+    track scanned pages in order and tell when a matched block of at least min_block pages is followed by
+    stop_gap unmatched pages; shorter blocks (e.g. a contents page or a passing mention) never stop the scan
+    '''
+    def __init__(self, stop_gap=None, min_block=1):
+        self.stop_gap = stop_gap
+        self.min_block = min_block
+        self.block = 0 # length of the current or last matched block
+        self.misses = 0
+
+    def update(self, page_nums: list, matched: set) -> bool:
+        for p in page_nums:
+            if p in matched:
+                if self.misses:
+                    self.block = 0
+                self.block, self.misses = self.block + 1, 0
+            elif self.block:
+                self.misses += 1
+        return bool(self.stop_gap) and self.block >= self.min_block and self.misses >= self.stop_gap
+
 
 class PDF(Logger):
+
+    cache = PDFCache() # set to None to disable the on-disk download cache
+    search_processes = None # worker processes of search_outline, None scans in process
+    search_stop_gap = 5 # unmatched pages after a matched block that end an early_stop search
+    search_min_block = 2 # pages a matched block needs before it can end an early_stop search
+    heading_index_columns = ['page_num', 'text', 'fontname', 'size', 'top', 'bottom', 'x0', 'x1']
+    use_font_profile = True # pages default to the document main font instead of their own modal font
+    font_profile_sample = 20 # pages sampled evenly across the document for the font profile
+
     def __init__(self, src):
         super().__init__()
         self.src = src
@@ -13,14 +139,9 @@ class PDF(Logger):
     @classmethod
     def create(cls, src):
         m_logger = super().get_module_logger()
-        src_types = {
-           type(src) is str and cls.is_url(src) : lambda: cls.byte_obj_from_url(src),
-           type(src) is str and os.path.isfile(src) : lambda: open(src, 'rb'),
-           type(src) is not str and cls.is_binary(src) : lambda: src
-        }
-        pdf_obj = src_types.get(True, lambda: None)()
-        if pdf_obj and pdf_obj.read().startswith(b'%PDF'):
-            return cls(src)
+        source = PDFSource(src)
+        if source.is_pdf:
+            return cls(source)
         m_logger.warning(f'{src} is not a valid pdf src file.')
         return None
 
@@ -30,13 +151,27 @@ class PDF(Logger):
 
     @src.setter
     def src(self, src):
-        self._pdf_obj = self.byte_obj_from_url(src) or src
+        source = src if isinstance(src, PDFSource) else PDFSource(src)
+        if not source.is_pdf:
+            raise ValueError(f'{source.src} is not a valid pdf src file.')
+        self._source = source
+        self._pdf_obj = source.open()
         self._pb_pdf = pdfplumber.open(self._pdf_obj)
-        self._src = src
+        self._pypdf_reader = None
+        self._outline_entries = None
+        self._outlines = None
+        self._heading_index = pd.DataFrame(columns=PDF.heading_index_columns)
+        self._indexed_pages = set()
+        self._font_profile = None
+        self._src = source.src
         self.logger.info(f'{self}.src set to {self._src}')
 
     @property
-    def pdf_obj(self) -> Union[str, object]:
+    def source(self) -> object:
+        return self._source
+
+    @property
+    def pdf_obj(self) -> object:
         return self._pdf_obj
 
     @property
@@ -45,16 +180,31 @@ class PDF(Logger):
 
     @property
     def pypdf_reader(self):
-        pdf_obj = self.pdf_obj
-        src = self.src
-        if type(pdf_obj) is str and os.path.isfile(pdf_obj):
-            pdf_obj = open(src, 'rb')
-        return PyPDF2.PdfFileReader(pdf_obj, strict=False)
+        if self._pypdf_reader is None:
+            self._pypdf_reader = PyPDF2.PdfFileReader(self.source.open(), strict=False)
+        return self._pypdf_reader
 
     @property
     def max_page_num(self):
         pdf = self.pb_pdf
         return len(pdf.pages)
+
+    @property
+    def outline_entries(self) -> list:
+        '''
+        flattened (title, destination page number) of every bookmark, parsed once per document
+        '''
+        if self._outline_entries is None:
+            pypdf_reader = self.pypdf_reader
+
+            def get_page_num(outline):
+                try:
+                    return pypdf_reader.getDestinationPageNumber(outline)
+                except AttributeError:
+                    return None
+
+            self._outline_entries = [(outline.title, get_page_num(outline)) for outline in flatten(pypdf_reader.getOutlines())]
+        return self._outline_entries
     
     @staticmethod
     def is_binary(obj) -> bool:
@@ -75,39 +225,76 @@ class PDF(Logger):
         return True if re.match(url_regex, src) else False
 
 
+    @staticmethod
+    def fetch(url: str) -> tuple:
+        '''
+        download url once, return (cached file path, None) when PDF.cache is set
+        or (None, content bytes) otherwise
+        '''
+        cache = PDF.cache
+        cached_path = cache.get(url) if cache else None
+        if cached_path:
+            return cached_path, None
+        with HttpClient.get(url) as response:
+            response.raise_for_status()
+            content = response.content
+        if cache and content.startswith(b'%PDF'):
+            return cache.put(url, content), None
+        return None, content
+
     @staticmethod
     def byte_obj_from_url(url: str) -> object:
         '''
-        get byteIO object from url
+        get byteIO object from url,
+        or a memory map of the cached file when PDF.cache is set
         '''
         if not PDF.is_url(url):
             return None
-        with requests.get(url) as response:
-            response.raise_for_status()
-            byte_obj = BytesIO(response.content)
-        return byte_obj
+        path, content = PDF.fetch(url)
+        return PDFCache.open(path) if path else BytesIO(content)
 
     def get_page(self, p: int):
         pdf = self.pb_pdf
-        return Page.create(pdf.pages[p])
+        return Page.create(pdf.pages[p], font_profile=self.font_profile)
+
+    @property
+    def font_profile(self) -> Union[FontProfile, None]:
+        '''
+        main fontnames and sizes of the document, counted once over PDF.font_profile_sample evenly spaced pages
+        '''
+        if not PDF.use_font_profile:
+            return None
+        if self._font_profile is None:
+            self._font_profile = self.sample_font_profile(range(len(self.pb_pdf.pages)))
+            self.logger.info(f'{self}.font_profile set to {self._font_profile}')
+        return self._font_profile
+
+    def get_font_profile(self, page_nums: list) -> Union[FontProfile, None]:
+        '''
+        the document font profile once it exists, otherwise one sampled within page_nums only, so reading a
+        bookmarked section parses no page outside it
+        '''
+        if not PDF.use_font_profile:
+            return None
+        return self._font_profile or self.sample_font_profile(page_nums)
+
+    def sample_font_profile(self, page_nums) -> FontProfile:
+        page_nums = list(page_nums)
+        step = max(1, len(page_nums) // PDF.font_profile_sample)
+        pages = self.pb_pdf.pages
+        return FontProfile.from_char_stores([CharStore.from_chars(pages[p].chars) for p in page_nums[::step][:PDF.font_profile_sample]])
 
     @property
     def outlines(self):
-        pypdf_reader = self.pypdf_reader
-        outlines = flatten(pypdf_reader.getOutlines())
-        
-        def get_page_num(outline):
-            try:
-                return pypdf_reader.getDestinationPageNumber(outline)
-            except AttributeError:
-                return None
-        
-        outlines = [outline for outline in outlines if get_page_num(outline)]
-        titles = [outline.title for outline in outlines]
-        starting_pages = [get_page_num(outline) for outline in outlines]
+        if self._outlines is not None:
+            return self._outlines
+        outlines = [(title, page_num) for title, page_num in self.outline_entries if page_num]
+        titles = [title for title, _ in outlines]
+        starting_pages = [page_num for _, page_num in outlines]
         ending_pages = [page_num - 1 for page_num in starting_pages[1:]]
         page_ranges = zip_longest(starting_pages, ending_pages, fillvalue=max(starting_pages, default=None))
-        return [Outline(title, page_range, self.pb_pdf) for title, page_range in zip(titles, page_ranges)]
+        self._outlines = [Outline(title, page_range, self.pb_pdf, pdf=self) for title, page_range in zip(titles, page_ranges)]
+        return self._outlines
 
     @property
     def toc(self):
@@ -120,28 +307,46 @@ class PDF(Logger):
         return toc
     
     @Logger.track
-    def get_outline(self, regex: Pattern) -> list:
+    def get_outline(self, regex: Pattern, prefilter: Pattern = None) -> list:
         '''
         return a list of outline that matches with the regex pattern
         '''
         outlines = self.outlines
         result = [outline for outline in outlines if outlines and re.search(regex, outline.title, flags=re.IGNORECASE)] 
-        return result if result else self.search_outline(regex)
+        return result if result else self.search_outline(regex, prefilter=prefilter)
     
     @Logger.track
-    def search_outline(self, regex: Pattern, scope=None) -> list:
+    def search_outline(self, regex: Pattern, scope=None, processes=None, early_stop=False, prefilter=None) -> list:
+        '''
+        search pages for feature text matching regex in the heading index, indexing the pages not indexed yet;
+            - processes: index / scan in that many worker processes (needs a file backed src, default PDF.search_processes)
+            - prefilter: pages not indexed yet whose raw text fails it are not indexed (see passes_prefilter)
+            - early_stop: scan pages in order instead, stop once a matched block of at least PDF.search_min_block pages is
+              followed by PDF.search_stop_gap unmatched pages; the result is the longest block seen up to there, so a longer
+              block later in the document is not considered
+        '''
         pdf = self.pb_pdf
         pages = scope or pdf.pages
-        
-        matched_page_nums = set()
-
-        for p in pages:
-            page = Page.create(p)
-            if not page or page.df_feature_text.empty:
-                continue
-            self.logger.debug(f'searching page {page.page_number}...')
-            if any(page.df_feature_text.text.str.contains(regex, flags=re.IGNORECASE)):
-                matched_page_nums.add(page.page_number)
+        page_nums = [p.page_number - 1 for p in pages]
+        processes = processes or PDF.search_processes
+        stop_gap = PDF.search_stop_gap if early_stop else None
+        min_block = PDF.search_min_block
+
+        if not early_stop:
+            matched_page_nums = set(self.search_headings(regex, page_nums, processes=processes, prefilter=prefilter).page_num)
+        elif processes and processes > 1 and self.source.path:
+            matched_page_nums = self.scan_pages_parallel(regex, page_nums, processes, stop_gap, prefilter, min_block)
+        else:
+            matched_page_nums = set()
+            scan = ScanProgress(stop_gap, min_block)
+            for p in page_nums:
+                self.logger.debug(f'searching page {p}...')
+                matched = page_matches(pdf.pages[p], regex, prefilter, self.font_profile, self.pypdf_reader if prefilter else None)
+                if matched:
+                    matched_page_nums.add(p)
+                if scan.update([p], {p} if matched else set()):
+                    self.logger.info(f'matched block ended before page {p}, stop searching')
+                    break
         
         matched_page_num = max(consecutive_int_list(sorted(matched_page_nums)), key=len, default=None)
         
@@ -150,22 +355,160 @@ class PDF(Logger):
         
         page_range = min(matched_page_num), max(matched_page_num)
         scope = 'Local' if scope else 'Global'
-        return [Outline(f'{scope} search pattern: {regex}', page_range, self.pb_pdf)]
+        return [Outline(f'{scope} search pattern: {regex}', page_range, self.pb_pdf, pdf=self)]
+
+    @property
+    def heading_index(self) -> pd.DataFrame:
+        return self.get_heading_index()
+
+    def get_heading_index(self, page_nums=None, processes=None, prefilter=None) -> pd.DataFrame:
+        '''
+        feature text lines of page_nums (default all pages) with page_num, font, size and position;
+        each page is indexed once, when first asked for (in worker processes when processes > 1 and src is file backed).
+        With a prefilter, pages not indexed yet whose raw text fails it are left out, as they cannot match
+        the regex the prefilter was written for
+        '''
+        page_nums = list(range(self.max_page_num)) if page_nums is None else list(page_nums)
+        missing = [p for p in page_nums if p not in self._indexed_pages]
+        if missing:
+            indexed, df = self.index_page_nums(missing, processes or PDF.search_processes, prefilter)
+            self._indexed_pages.update(indexed)
+            if not df.empty:
+                self._heading_index = df if self._heading_index.empty else pd.concat([self._heading_index, df], ignore_index=True)
+            self.logger.info(f'{len(indexed)} of {len(missing)} pages added to heading index, {len(self._indexed_pages)} pages indexed')
+        index = self._heading_index
+        return index[index.page_num.isin(page_nums)]
+
+    def index_page_nums(self, page_nums: list, processes=None, prefilter=None) -> tuple:
+        '''
+        (indexed page numbers, their feature text lines) of page_nums passing prefilter
+        '''
+        if processes and processes > 1 and self.source.path:
+            chunk_size = max(1, -(-len(page_nums) // (processes * 4)))
+            chunks = [page_nums[i:i + chunk_size] for i in range(0, len(page_nums), chunk_size)]
+            with ProcessPoolExecutor(max_workers=processes) as executor:
+                results = list(executor.map(index_pages, [self.source.path] * len(chunks), chunks, [self.font_profile] * len(chunks), [prefilter] * len(chunks)))
+            indexed = flatten([chunk_indexed for chunk_indexed, _ in results])
+            dfs = [df for _, df in results if not df.empty]
+        else:
+            pypdf_reader = self.pypdf_reader if prefilter else None
+            indexed = [p for p in page_nums if passes_prefilter(self.pb_pdf.pages[p], prefilter, pypdf_reader)]
+            dfs = [df for df in (feature_text_rows(self.pb_pdf.pages[p], self.font_profile) for p in indexed) if not df.empty]
+        return indexed, pd.concat(dfs, ignore_index=True) if dfs else pd.DataFrame(columns=PDF.heading_index_columns)
+
+    def search_headings(self, regex: Pattern, page_nums=None, processes=None, prefilter=None) -> pd.DataFrame:
+        '''
+        heading index lines matching regex, optionally within page_nums
+        '''
+        index = self.get_heading_index(page_nums, processes, prefilter)
+        return index[index.text.str.contains(regex, flags=re.IGNORECASE)]
+
+    def scan_pages_parallel(self, regex: Pattern, page_nums: list, processes: int, stop_gap=None, prefilter=None, min_block=1) -> set:
+        '''
+        partition page_nums into chunks scanned by a process pool, each worker reopens the document by path;
+        chunks are merged in page order so early stopping sees pages in sequence
+        '''
+        path = self.source.path
+        chunk_size = max(1, -(-len(page_nums) // (processes * 4)))
+        chunks = [page_nums[i:i + chunk_size] for i in range(0, len(page_nums), chunk_size)]
+        self.logger.info(f'scanning {len(page_nums)} pages in {len(chunks)} chunks with {processes} processes')
+        matched_page_nums = set()
+        scan = ScanProgress(stop_gap, min_block)
+        executor = ProcessPoolExecutor(max_workers=processes)
+        try:
+            futures = [executor.submit(scan_pages, path, chunk, regex, prefilter, self.font_profile) for chunk in chunks]
+            for chunk, future in zip(chunks, futures):
+                matched = set(future.result())
+                matched_page_nums |= matched
+                if scan.update(chunk, matched):
+                    self.logger.info(f'matched block ended by page {chunk[-1]}, stop searching')
+                    break
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+        return matched_page_nums
 
     
     def __repr__(self):
         return f'{self.__class__.__name__}(src="{self.src}")'
 
 
+class PDFSource:
+
+    '''
+    pdf src (url, file path or binary object) resolved exactly once;
+    every open() returns an independent stream over the same buffer
+    '''
+
+    def __init__(self, src):
+        self.src = src
+        self.path = None
+        self.content = None
+        self.obj = None
+        if isinstance(src, str) and PDF.is_url(src):
+            self.path, self.content = PDF.fetch(src)
+        elif isinstance(src, str) and os.path.isfile(src):
+            self.path = src
+        elif PDF.is_binary(src):
+            self.obj = src
+            self.obj.seek(0)
+            self.content = self.obj.read()
+
+    @property
+    def head(self) -> bytes:
+        if self.path:
+            with open(self.path, 'rb') as f:
+                return f.read(5)
+        if self.content is not None:
+            return self.content[:5]
+        return b''
+
+    @property
+    def is_pdf(self) -> bool:
+        return self.head.startswith(b'%PDF')
+
+    def open(self) -> object:
+        '''
+        files are memory mapped and bytes are shared by BytesIO, so no stream copies the document;
+        binary objects are read into bytes once in __init__, so their streams do not share a seek position either
+        '''
+        if self.path:
+            return PDFCache.open(self.path)
+        return BytesIO(self.content)
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}(src="{self.src}")'
+
+
 class Page(Logger):
-    def __init__(self, page, df_lang=None):
+
+    '''
+    layout analysis of a pdfplumber page; language filtered views are get_* methods taking lang explicitly
+    ('en', 'cn' or None for all), properties are the views of df_lang. Nothing is mutated while analysing
+    so a created page can be read from several threads.
+    '''
+
+    feature_text_lang = 'en' # language of df_feature_text, None follows df_lang / the language asked
+
+    def __init__(self, page, df_lang=None, font_profile=None):
         self.page = page
         self.df_lang = df_lang
+        self.font_profile = font_profile
+
+    @property
+    def page(self) -> object:
+        return self._page
+
+    @page.setter
+    def page(self, page):
+        self._page = page
+        self._cache = {}
 
     @classmethod
     def create(cls, page, **kwargs):
         try:
             page = cls(page=page, **kwargs)
+            if not len(page.char_store):
+                raise ValueError('page has no chars')
             page.df_main_text
             page.remove_noise()
             return page
@@ -186,54 +529,113 @@ class Page(Logger):
         return self.page.page_number - 1
 
     @property
+    @page_cache
     def text(self) -> str:
         txt = self.page.extract_text()
         txt = txt.replace('ﬁ', 'fi')  # must clean before chinese
         txt = re.sub(r'\ufeff', ' ', txt)  # clear BOM
         return txt
 
+    @property
+    def char_store(self) -> CharStore:
+        '''
+        columnar chars of the page, shared by every language mode
+        '''
+        char_store = self._cache.get('char_store')
+        if char_store is None:
+            char_store = self._cache['char_store'] = CharStore.from_chars(self.page.chars)
+        return char_store
+
+    @page_cache
+    def get_char_mask(self, lang=None):
+        '''
+        chars of lang with a valid bbox
+        '''
+        return self.char_store.mask(lang)
+
+    @page_cache
+    def get_main_fontname(self, lang=None) -> pd.Series:
+        '''
+        document font profile unless the page clearly deviates from it, otherwise the modal font of the page
+        '''
+        mask = self.get_char_mask(lang)
+        font_profile = self.font_profile
+        main_fontname = font_profile.main_fontname(self.char_store, mask, lang) if font_profile else None
+        return self.char_store.mode_fontnames(mask) if main_fontname is None else main_fontname
+
+    @page_cache
+    def get_main_fontsize(self, lang=None) -> pd.Series:
+        char_store = self.char_store
+        mask = self.get_char_mask(lang) & char_store.font_mask(self.get_main_fontname(lang))
+        font_profile = self.font_profile
+        main_fontsize = font_profile.main_fontsize(char_store, mask, lang) if font_profile else None
+        return char_store.mode_sizes(mask) if main_fontsize is None else main_fontsize
+
+    @page_cache
+    def get_df_char(self, lang=None) -> pd.DataFrame:
+        return self.char_store.frame(self.get_char_mask(lang))
+
+    @page_cache
+    def get_df_main_text(self, lang=None) -> pd.DataFrame:
+        char_store = self.char_store
+        is_main_fontname = char_store.font_mask(self.get_main_fontname(lang))
+        is_main_fontsize = char_store.size_mask(self.get_main_fontsize(lang))
+        return char_store.frame(self.get_char_mask(lang) & is_main_fontname & is_main_fontsize & char_store.upright)
+
+    @page_cache
+    def get_df_feature_text(self, lang=None) -> pd.DataFrame:
+        char_store = self.char_store
+        df_ft = char_store.frame(self.get_char_mask(lang) & ~char_store.font_mask(self.get_main_fontname(lang)))
+        df_feature_text = df_ft.groupby(['top', 'bottom', 'fontname', 'size']).agg(
+            {'x0': 'min', 'x1': 'max', 'text': ''.join}).reset_index()
+        if df_feature_text.empty:
+            return df_feature_text
+        df_feature_text = df_feature_text[df_feature_text.text.str.contains(r'\w+')]
+        return df_feature_text
+
+    @page_cache
+    def get_bbox_main_text(self, lang=None) -> Union[tuple, None]:
+        '''
+        bbox of main text of lang, extended by its feature text
+        '''
+        df_main_text = self.get_df_main_text(lang)
+        if df_main_text.empty:
+            return None
+        
+        x0 = df_main_text.x0.min()
+        top = df_main_text.top.min()
+        x1 = df_main_text.x1.max()
+        bottom = df_main_text.bottom.max()
+        
+        df_feature_text = self.get_df_feature_text(self.feature_text_lang or lang)
+        if not df_feature_text.empty:
+            top = min(top, df_feature_text['top'].min())
+            x1 = max(x1, df_feature_text['x1'].max())
+        return float(x0), float(top), float(x1), float(bottom)
+
+    @property
+    def char_mask(self):
+        return self.get_char_mask(self.df_lang)
+
     @property
     def df_char(self) -> pd.DataFrame:
-        df = pd.DataFrame(self.page.chars)
-        df_langs = {
-            'en': df[~df['text'].str.contains(r'[^\x00-\x7F]+')],
-            'cn': df[df['text'].str.contains(r'[^\x00-\x7F]+')]
-        }
-        df = df_langs.get(self.df_lang, df)
-        normal_bbx_coord = (df.x0 > 0) & (df.top > 0) & (df.x1 > 0) & (df.bottom > 0)
-        normal_x1 = df['x1'] <= self.page.width
-        within_bbx = normal_bbx_coord
-        df_char_within_bbox = df[within_bbx]
-        return df_char_within_bbox
+        return self.get_df_char(self.df_lang)
 
     @property
+    @page_cache
     def df_decarative_text(self) -> pd.DataFrame:
-        df_char = self.df_char
-        return df_char[df_char['upright'] == 0]
+        return self.char_store.frame(self.char_mask & ~self.char_store.upright)
 
     @property
     def df_main_text(self) -> pd.DataFrame:
-        df_char = self.df_char
-        is_main_fontname = df_char['fontname'].isin(self.main_fontname)
-        is_main_fontsize = df_char['size'].isin(self.main_fontsize)
-        is_upright = df_char['upright'] == 1
-        mt_df = df_char[is_main_fontname & is_main_fontsize & is_upright]
-        return mt_df
+        return self.get_df_main_text(self.df_lang)
 
     @property
     def df_feature_text(self) -> pd.DataFrame:
-        self.df_lang = 'en'
-        df_ft = self.df_char[~self.df_char['fontname'].isin(self.main_fontname)]
-        df_feature_text = df_ft.groupby(['top', 'bottom', 'fontname', 'size']).agg(
-            {'x0': 'min', 'x1': 'max', 'text': lambda x: ''.join(x)}).reset_index()
-        if df_feature_text.empty:
-            return df_feature_text
-        df_feature_text = df_feature_text[df_feature_text.text.str.contains(r'\w+')]
-
-        self.df_lang = None
-        return df_feature_text
+        return self.get_df_feature_text(self.feature_text_lang or self.df_lang)
 
     @property
+    @page_cache
     def df_bold_text(self) -> pd.DataFrame:
         df_feature_text = self.df_feature_text
         if df_feature_text.empty:
@@ -244,6 +646,7 @@ class Page(Logger):
         return df_bold_text
 
     @property
+    @page_cache
     def df_title_text(self) -> pd.DataFrame:
         df_feature_text = self.df_feature_text
         if df_feature_text.empty:
@@ -256,6 +659,7 @@ class Page(Logger):
         return df_title_text
 
     @property
+    @page_cache
     def df_section_text(self) -> pd.DataFrame:
         df = self.df_title_text
         if df.empty: return df
@@ -271,43 +675,22 @@ class Page(Logger):
             'text': ''.join
         })
         df_section_text['next_top'] = df_section_text.top.shift(-1)
-        df_section_text.fillna(self.page.height, inplace=True)
+        df_section_text.fillna(float(self.page.height), inplace=True)
         return df_section_text
 
     
     @property
     def main_fontname(self) -> pd.Series:
-        return self.df_char['fontname'].mode()
+        return self.get_main_fontname(self.df_lang)
 
     @property
     def main_fontsize(self) -> pd.Series:
-        df_char = self.df_char
-        return df_char[df_char['fontname'].isin(self.main_fontname)]['size'].mode()
+        return self.get_main_fontsize(self.df_lang)
 
     @property
+    @page_cache
     def bbox_main_text(self) -> tuple:
-
-        def bbox(lang):
-            self.df_lang = lang
-            df_main_text = self.df_main_text
-            if df_main_text.empty:
-                return None
-            
-            x0 = df_main_text.x0.min()
-            top = df_main_text.top.min()
-            x1 = df_main_text.x1.max()
-            bottom = df_main_text.bottom.max()
-            
-            df_feature_text = self.df_feature_text
-            if not df_feature_text.empty:
-                top = [top, df_feature_text['top'].min()]
-                x1 = [x1, df_feature_text['x1'].max()]                
-                self.df_lang = None
-                return x0, min(top), max(x1), bottom
-            self.df_lang = None
-            return x0, top, x1, bottom
-
-        en_bbx, cn_bbx = bbox('en'), bbox('cn')
+        en_bbx, cn_bbx = self.get_bbox_main_text('en'), self.get_bbox_main_text('cn')
 
         if not (en_bbx and cn_bbx):
             return en_bbx or cn_bbx
@@ -316,13 +699,14 @@ class Page(Logger):
         return min(x0), min(top), max(x1), max(bottom)
 
     @property
+    @page_cache
     def col_division(self) -> float:
         min_x0 = self.df_title_text.x0.min()
         max_x0 = self.df_title_text.x0.max()
         x0, top, x1, bottom = self.bbox_main_text
         if min_x0 != max_x0 and max_x0 > x0:
             self.logger.info(f'There is another colmun divided at {float(max_x0)}.')
-            return max_x0
+            return float(max_x0)
         return None
 
     @property
@@ -334,7 +718,7 @@ class Page(Logger):
         x0, top, x1, bottom = self.bbox_main_text
         l_bbx = x0, top, col_division, bottom
         left_col = self.page.crop(l_bbx, relative=False)
-        return Section.create(left_col, title='Left Column')
+        return Section.create(left_col, title='Left Column', font_profile=self.font_profile)
 
     @property
     def right_column(self) -> object:
@@ -351,7 +735,7 @@ class Page(Logger):
         except ValueError:
             r_bbx = col_division, top, self.page.width, bottom
             right_col = self.page.crop(r_bbx, relative=False)
-        return Section.create(right_col, title='Right Column')
+        return Section.create(right_col, title='Right Column', font_profile=self.font_profile)
 
     @property
     def sections(self) -> list:
@@ -360,7 +744,7 @@ class Page(Logger):
 
         def section_bbx(self, section):
             x0, top, x1, bottom = self.bbox_main_text
-            x0, top, x1, bottom = x0, section.top, x1, section.next_top
+            x0, top, x1, bottom = x0, float(section.top), x1, float(section.next_top)
             if top >= bottom:
                 return None
             return x0, top, x1, bottom
@@ -370,7 +754,7 @@ class Page(Logger):
             sec_bbx = section_bbx(self, sec)
             if not sec_bbx: continue
             section = self.page.crop(sec_bbx, relative=False)
-            section = Section.create(section, title=sec.text)
+            section = Section.create(section, title=sec.text, font_profile=self.font_profile)
             if section:
                 sections.append(section)
         return sections
@@ -397,7 +781,7 @@ class Page(Logger):
 
     def create_section(self, sec_bbx, title=None, relative=False):
         sec = self.page.within_bbox(sec_bbx, relative=relative)
-        return Section.create(sec, title=title)
+        return Section.create(sec, title=title, font_profile=self.font_profile)
 
     def divide_into_two_cols(self, d=0.5, relative=True):
         l0, l1 = 0 * float(self.page.width), d * float(self.page.width)
@@ -414,36 +798,24 @@ class Page(Logger):
 
     
     def to_bilingual(self):
-        return Page_bilingual.create(self.page)
+        return Page_bilingual.create(self.page, font_profile=self.font_profile)
 
     def __repr__(self):
         return f'<{self.__class__.__name__} {self.page_number}>'
 
 
 class Page_bilingual(Page):
-    def __init__(self, page):
-        super().__init__(page)
-    
-    @property
-    def df_feature_text(self) -> pd.DataFrame:
-        df_ft = self.df_char[~self.df_char['fontname'].isin(self.main_fontname)]
-        df_feature_text = df_ft.groupby(['top', 'bottom', 'fontname', 'size']).agg({
-            'x0': 'min', 
-            'x1': 'max', 
-            'text': ''.join
-            }).reset_index()
-        if df_feature_text.empty:
-            return df_feature_text
-        df_feature_text = df_feature_text[df_feature_text.text.str.contains(r'\w+')]
-        return df_feature_text
+
+    feature_text_lang = None
+
+    def __init__(self, page, font_profile=None):
+        super().__init__(page, font_profile=font_profile)
 
     @property
+    @page_cache
     def df_section_text(self) -> pd.DataFrame:
-        self.df_lang = 'en'
-        df_en = self.df_feature_text
-        self.df_lang = 'cn'
-        df_cn = self.df_feature_text
-        self.df_lang = None
+        df_en = self.get_df_feature_text('en')
+        df_cn = self.get_df_feature_text('cn')
         
         def df_section_text(df):
             if df.empty:
@@ -461,15 +833,16 @@ class Page_bilingual(Page):
             })
             return df_section_text
         
-        df_section_text = df_section_text(df_en).append(df_section_text(df_cn))
+        df_section_text = pd.concat([df_section_text(df_en), df_section_text(df_cn)])
         if df_section_text.empty:
             return df_section_text
         df_section_text.sort_values(by=['top'], inplace=True)
         df_section_text['next_top'] = df_section_text.top.shift(-1)
-        df_section_text.fillna(self.page.height, inplace=True)
+        df_section_text.fillna(float(self.page.height), inplace=True)
         return df_section_text
     
     @property
+    @page_cache
     def df_page_top_feature_text(self):
         df = self.df_section_text
         if df.empty:
@@ -477,6 +850,7 @@ class Page_bilingual(Page):
         return df[df.top/df.bottom.max() < 0.2]
 
     @property
+    @page_cache
     def col_division(self) -> Union[None, float]:
         df_section_text = self.df_section_text
         if df_section_text.empty:
@@ -497,27 +871,131 @@ class Page_bilingual(Page):
 
 
 class Section(Page):
-    def __init__(self, page, title=None):
-        super().__init__(page)
+    def __init__(self, page, title=None, font_profile=None):
+        super().__init__(page, font_profile=font_profile)
         self.title = title
 
     def __repr__(self):
         return f'<{self.__class__.__name__}: {self.title}>'
 
 
+class LazyPages(Sequence):
+
+    '''
+    pages of page_nums, each created by Page.create only when first touched and kept afterwards;
+    pages which fail Page.create are skipped like the None filtering in ReportOutline used to do
+
+    note:
+        - the numbers of good pages found from either end are kept, so pages[i] and pages[-i] create pages only up to
+          the i-th good page from that end once and are lookups afterwards
+        - len(pages) and slices without a non negative stop need every page, they create each page (once)
+    '''
+
+    def __init__(self, pb_pdf, page_nums, font_profile=None):
+        self.pb_pdf = pb_pdf
+        self.page_nums = list(page_nums)
+        self.font_profile = font_profile
+        self._pages = {}
+        self._head, self._head_scanned = [], 0 # good page numbers of the first _head_scanned page_nums
+        self._tail, self._tail_scanned = [], 0 # good page numbers of the last _tail_scanned page_nums, last first
+
+    def raw(self, p: int) -> object:
+        return self.pb_pdf.pages[p]
+
+    def page(self, p: int) -> Union[Page, None]:
+        if p not in self._pages:
+            self._pages[p] = Page.create(self.pb_pdf.pages[p], font_profile=self.font_profile)
+        return self._pages[p]
+
+    def head(self, n: int = None) -> list:
+        '''
+        numbers of the first n good pages (all if n is None), creating pages only as far as needed
+        '''
+        while self._head_scanned < len(self.page_nums) and (n is None or len(self._head) < n):
+            p = self.page_nums[self._head_scanned]
+            self._head_scanned += 1
+            if self.page(p):
+                self._head.append(p)
+        return self._head if n is None else self._head[:n]
+
+    def tail(self, n: int) -> list:
+        '''
+        numbers of the last n good pages, last first
+        '''
+        if self._head_scanned == len(self.page_nums):
+            return self._head[::-1][:n]
+        while self._tail_scanned < len(self.page_nums) and len(self._tail) < n:
+            p = self.page_nums[-1 - self._tail_scanned]
+            self._tail_scanned += 1
+            if self.page(p):
+                self._tail.append(p)
+        return self._tail[:n]
+
+    def __iter__(self):
+        i = 0
+        while len(self.head(i + 1)) > i:
+            yield self._pages[self._head[i]]
+            i += 1
+
+    def __reversed__(self):
+        i = 0
+        while True:
+            tail = self.tail(i + 1)
+            if len(tail) <= i:
+                return
+            yield self._pages[tail[i]]
+            i += 1
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            bounded = i.stop is not None and i.stop >= 0 and (i.start or 0) >= 0 and (i.step or 1) > 0
+            return [self._pages[p] for p in self.head(i.stop if bounded else None)][i]
+        page_nums = self.head(i + 1)[i:] if i >= 0 else self.tail(-i)[-i - 1:]
+        if not page_nums:
+            raise IndexError('page index out of range')
+        return self._pages[page_nums[0]]
+
+    def __len__(self):
+        return len(self.head())
+
+    def within(self, from_page: int, to_page: int) -> list:
+        '''
+        pages numbered from_page to to_page, creating only those
+        '''
+        pages = [self.page(p) for p in self.page_nums if from_page <= p <= to_page]
+        return [page for page in pages if page]
+
+    def __bool__(self):
+        return bool(self.head(1))
+
+    def __repr__(self):
+        return f'<{self.__class__.__name__} {self.page_nums}>'
+
+
 class Outline:
     
-    def __init__(self, title, page_range, pb_pdf):
+    def __init__(self, title, page_range, pb_pdf, pdf=None):
         self.title = title
         self.page_range = page_range
         self.pb_pdf = pb_pdf
+        self.pdf = pdf
+        self._pages = None
     
 
     @property
-    def pages(self):
+    def pages(self) -> LazyPages:
         page_range = self.page_range
-        pb_pdf = self.pb_pdf
-        return [Page.create(pb_pdf.pages[p]) for p in page_range]
+        if self._pages is None or self._pages.page_nums != page_range:
+            self._pages = LazyPages(self.pb_pdf, page_range, self.pdf.get_font_profile(page_range) if self.pdf else None)
+        return self._pages
+
+    def search_headings(self, regex: Pattern, prefilter: Pattern = None) -> Union[pd.DataFrame, None]:
+        '''
+        heading index lines of the outline pages matching regex, None without a pdf to index
+        '''
+        if self.pdf is None:
+            return None
+        return self.pdf.search_headings(regex, self.page_range, prefilter=prefilter)
 
     @property
     def page_range(self) -> list:
@@ -554,12 +1032,26 @@ class Outline:
 class PageWithSection:
     
     section_regex = r''
+    prefilter_regex = None # see passes_prefilter
     
     def __init__(self, pages):
         self.pages = pages
     
     @classmethod
-    def retrieve(cls, pages):
+    def retrieve(cls, pages, outline=None):
+        '''
+        pages from the first to the last page with a section title matching section_regex;
+        looked up in the document heading index through outline when it has a pdf
+        '''
+        headings = outline.search_headings(cls.section_regex, cls.prefilter_regex) if outline is not None and isinstance(pages, LazyPages) else None
+        if headings is not None:
+            page_range = headings.page_num.tolist()
+            related_pages = pages.within(min(page_range), max(page_range)) if page_range else []
+            return cls(related_pages) if related_pages else None
+        if cls.prefilter_regex and isinstance(pages, LazyPages):
+            page_range = [p for p in pages.page_nums if passes_prefilter(pages.raw(p), cls.prefilter_regex) and cls.section_matches(pages.page(p))]
+            related_pages = pages.within(min(page_range), max(page_range)) if page_range else []
+            return cls(related_pages) if related_pages else None
         page_range = []
         for page in pages:
             if page.df_feature_text.empty:
@@ -570,12 +1062,19 @@ class PageWithSection:
         related_pages = [page for page in pages if page_range and page.page_number in range(min(page_range), max(page_range) + 1)]
         return cls(related_pages) if related_pages else None
     
+    @classmethod
+    def section_matches(cls, page) -> bool:
+        if not page or page.df_feature_text.empty:
+            return False
+        return page.df_feature_text.text.str.contains(cls.section_regex, flags=re.IGNORECASE).any()
+    
     def __repr__(self):
         return f'<{self.__class__.__name__}>'
 
 class ReportOutline:
 
     title_regex = r''
+    prefilter_regex = None # see passes_prefilter
     
     def __init__(self, outline):
         self.pages = outline
@@ -598,15 +1097,20 @@ class ReportOutline:
 
     @pages.setter
     def pages(self, outline):
-        self._pages = [page for page in outline.pages if page]
+        self._outline = outline
+        self._pages = outline.pages
+
+    @property
+    def outline(self) -> Outline:
+        return self._outline
     
     @property
     def from_page(self):
-        return min([page.page_number for page in self.pages])
+        return self.pages[0].page_number
     
     @property
     def to_page(self):
-        return max([page.page_number for page in self.pages])
+        return self.pages[-1].page_number
     
     def __repr__(self):
         return f'<{self.__class__.__name__} p.{self.from_page} - {self.to_page}>'
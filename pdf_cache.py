@@ -0,0 +1,113 @@
+import os, mmap, time, sqlite3, hashlib, threading
+from contextlib import contextmanager
+from typing import Union
+from logger import Logger
+
+class PDFCache(Logger):
+
+    '''
+    usage:
+        persistent on-disk cache of downloaded pdf files
+
+    note:
+        - entries are keyed by url (file_link), files are stored by content sha256 so identical files are kept once
+        - total size is capped by max_bytes, least recently used files are evicted first
+        - cached files are opened as read-only memory maps instead of being copied into memory
+    '''
+
+    dir_ = '.pdf_cache'
+    max_bytes = 2 * 1024 ** 3
+    index_name = 'index.db'
+
+    def __init__(self, dir_=None, max_bytes=None):
+        super().__init__()
+        self.dir_ = dir_ or PDFCache.dir_
+        self.max_bytes = max_bytes or PDFCache.max_bytes
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def index(self):
+        with self._lock:
+            if not os.path.exists(self.dir_):
+                os.makedirs(self.dir_, exist_ok=True)
+            con = sqlite3.connect(os.path.join(self.dir_, self.index_name), timeout=30)
+            try:
+                con.execute('CREATE TABLE IF NOT EXISTS entry (url TEXT PRIMARY KEY, sha256 TEXT NOT NULL, size INTEGER NOT NULL, accessed_on REAL NOT NULL)')
+                con.execute('CREATE INDEX IF NOT EXISTS ix_entry_sha256 ON entry (sha256)')
+                yield con
+                con.commit()
+            except:
+                con.rollback()
+                raise
+            finally:
+                con.close()
+
+    def file_path(self, sha256: str) -> str:
+        return os.path.join(self.dir_, f'{sha256}.pdf')
+
+    def get(self, url: str) -> Union[str, None]:
+        '''
+        return cached file path of url and mark it as recently used
+        '''
+        with self.index() as con:
+            row = con.execute('SELECT sha256 FROM entry WHERE url = ?', (url,)).fetchone()
+            if row is None:
+                return None
+            path = self.file_path(row[0])
+            if not os.path.isfile(path):
+                con.execute('DELETE FROM entry WHERE url = ?', (url,))
+                return None
+            con.execute('UPDATE entry SET accessed_on = ? WHERE url = ?', (time.time(), url))
+        self.logger.debug(f'cache hit {url}')
+        return path
+
+    def put(self, url: str, content: bytes) -> str:
+        '''
+        store content of url and return the cached file path
+        '''
+        sha256 = hashlib.sha256(content).hexdigest()
+        path = self.file_path(sha256)
+        with self.index() as con:
+            if not os.path.isfile(path):
+                tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+                with open(tmp_path, 'wb') as f:
+                    f.write(content)
+                os.replace(tmp_path, path)
+            con.execute('INSERT OR REPLACE INTO entry (url, sha256, size, accessed_on) VALUES (?, ?, ?, ?)', (url, sha256, len(content), time.time()))
+            self.evict(con, keep=sha256)
+        self.logger.debug(f'cached {url} as {path}')
+        return path
+
+    def evict(self, con: sqlite3.Connection, keep: str = None) -> None:
+        '''
+        remove least recently used files until the cache fits in max_bytes
+        '''
+        files = con.execute('SELECT sha256, max(size), max(accessed_on) AS last_access FROM entry GROUP BY sha256 ORDER BY last_access').fetchall()
+        total = sum(size for _, size, _ in files)
+        for sha256, size, _ in files:
+            if total <= self.max_bytes:
+                break
+            if sha256 == keep:
+                continue
+            con.execute('DELETE FROM entry WHERE sha256 = ?', (sha256,))
+            try:
+                os.remove(self.file_path(sha256))
+            except FileNotFoundError:
+                pass
+            total -= size
+            self.logger.debug(f'evicted {sha256}')
+
+    @staticmethod
+    def open(path: str) -> mmap.mmap:
+        '''
+        open a cached file as a read-only memory map
+        '''
+        with open(path, 'rb') as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}(dir_="{self.dir_}")'
+
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,38 @@
+import re, random
+from keyword_matcher import KeywordMatcher
+
+keywords = ['goodwill', 'impairment', 'impairment of goodwill', 'asset', 'financial asset', 'value', 'fair value',
+            'key', 'revenue recognition', r'expected credit loss(es)?', 'inventor(y|ies)']
+
+strings = ['İmpairment of goodwill', 'IMPAİRMENT', 'ımpairment of GOODWİLL', 'Financial aſſets', 'KEY matters',
+           'Fair Value of financial assets', 'Straße revenue recognition', '商譽減值 impairment', '', None,
+           'Expected credit losses on inventories']
+
+
+def expected(string):
+    return sorted(keyword for keyword in keywords if re.search(keyword, string or '', re.IGNORECASE))
+
+
+def random_strings(n=300, seed=0):
+    rng = random.Random(seed)
+    pieces = keywords[:8] + [' ', ' of ', 'İ', 'ı', 'ſ', 'K', 'ß', '商', 'x', '\n']
+    for _ in range(n):
+        string = ''.join(rng.choice(pieces) for _ in range(rng.randint(0, 8)))
+        yield ''.join(char.upper() if rng.random() < 0.3 else char for char in string)
+
+
+def test_tags_equal_ignorecase_search():
+    matcher = KeywordMatcher(keywords)
+    for string in strings + list(random_strings()):
+        assert matcher.tags(string or '') == expected(string), string
+
+
+def test_tag_many_equals_tags():
+    matcher = KeywordMatcher(keywords)
+    column = strings + list(random_strings())
+    assert matcher.tag_many(column) == [expected(string) for string in column]
+
+
+def test_dotted_capital_i():
+    matcher = KeywordMatcher(keywords)
+    assert matcher.tags('İmpairment of goodwill') == ['goodwill', 'impairment', 'impairment of goodwill']
@@ -17,9 +17,16 @@ class TableOfContent:
     def __init__(self, pdf_obj):
         # super().__init__(src)
         self.pdf_obj = pdf_obj
+        self._toc = None
+        self._title_liked_txts = {}
      
     @property
     def toc(self):
+        if self._toc is None:
+            self._toc = self.read_toc()
+        return self._toc
+
+    def read_toc(self):
         with _by_pypdf(self.pdf_obj) as pdf:
             outlines = flatten(pdf.getOutlines())
             outlines, next_outlines = TableOfContent.current_next_outline_pairs(outlines)
@@ -86,7 +93,7 @@ class TableOfContent:
                 # if verbose: print(f'searching p.{p}')
                 
                 try:
-                    title_alike_txts = get_title_liked_txt(page, size=size)
+                    title_alike_txts = self.title_liked_txts(page, size=size)
                 except KeyError:
                     logging.warning('Non textual page')
                     continue
@@ -102,6 +109,15 @@ class TableOfContent:
             return consecutive_pages
 
 
+    def title_liked_txts(self, page, size='fontname') -> list:
+        '''
+        title liked texts of a page, extracted once per (page, size) for every pattern searched
+        '''
+        key = (page.page_number, size)
+        if key not in self._title_liked_txts:
+            self._title_liked_txts[key] = list(get_title_liked_txt(page, size=size))
+        return self._title_liked_txts[key]
+
     def search_outline_in_toc(self, pattern) -> list:
         '''
         return a list of matched title pattern page range